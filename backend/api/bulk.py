@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from rest_framework import permissions, serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+
+from assistance.cache import bump_version
+from assistance.parsers import NDJSONParser
+from recipes.counters import change_counter
+from recipes.models import AmountOfIngredient, Ingredient, Recipe, Tag
+from recipes.tasks import schedule_renditions
+from users.models import User
+from .serializers import RecipeCreateOrUpdateSerializer
+
+ID_FIELD = serializers.IntegerField()
+
+
+def coerce_id(value):
+    """id так, как его примет IntegerField сериализатора, или None."""
+    try:
+        return ID_FIELD.to_internal_value(value)
+    except ValidationError:
+        return None
+
+
+def referenced_ids(items):
+    """Все id тегов и ингредиентов, упомянутые в пачке рецептов."""
+    tag_ids, ingredient_ids = set(), set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        tags = item.get('tags')
+        if isinstance(tags, list):
+            tag_ids.update(coerce_id(pk) for pk in tags)
+        ingredients = item.get('ingredients')
+        if isinstance(ingredients, list):
+            ingredient_ids.update(
+                coerce_id(ingredient.get('id')) for ingredient in ingredients
+                if isinstance(ingredient, dict))
+    tag_ids.discard(None)
+    ingredient_ids.discard(None)
+    return tag_ids, ingredient_ids
+
+
+def insert_recipes(author, batch):
+    """Записывает пачку проверенных рецептов со связями.
+
+    Если СУБД возвращает id после bulk_create, рецепты вставляются одним
+    запросом, а счетчик рецептов автора правится вручную; иначе рецепты
+    сохраняются по одному (счетчик и копии изображений обновят сигналы).
+    Теги и ингредиенты всей пачки вставляются двумя запросами.
+    """
+    recipes = []
+    for data in batch:
+        data = dict(data)
+        data.pop('tags')
+        data.pop('ingredients')
+        recipes.append(Recipe(author=author, **data))
+    if connection.features.can_return_rows_from_bulk_insert:
+        Recipe.objects.bulk_create(recipes)
+        change_counter(User, 'recipes_count', (author.pk,), len(recipes))
+        for recipe in recipes:
+            schedule_renditions(recipe)
+    else:
+        for recipe in recipes:
+            recipe.save()
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+        for recipe, data in zip(recipes, batch)
+        for tag_id in data['tags']])
+    AmountOfIngredient.objects.bulk_create([
+        AmountOfIngredient(recipe=recipe, ingredient_id=ingredient['id'],
+                           amount=ingredient['amount'])
+        for recipe, data in zip(recipes, batch)
+        for ingredient in data['ingredients']])
+    return recipes
+
+
+class BulkRecipeCreateMixin:
+    """Пакетное создание рецептов: JSON-массив или NDJSON."""
+
+    @action(detail=False, url_path='bulk', methods=('post',),
+            permission_classes=(permissions.IsAuthenticated,),
+            parser_classes=(JSONParser, NDJSONParser))
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError(
+                {'non_field_errors': ['Ожидается список рецептов.']})
+        if not items or len(items) > settings.MAX_BULK_RECIPES:
+            raise ValidationError({'non_field_errors': [
+                'В запросе должно быть от 1 до {} рецептов.'.format(
+                    settings.MAX_BULK_RECIPES)]})
+        tag_ids, ingredient_ids = referenced_ids(items)
+        context = self.get_serializer_context()
+        context['known_ids'] = {
+            Tag: set(Tag.objects.filter(id__in=tag_ids).values_list(
+                'id', flat=True)),
+            Ingredient: set(Ingredient.objects.filter(
+                id__in=ingredient_ids).values_list('id', flat=True)),
+        }
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = RecipeCreateOrUpdateSerializer(
+                data=item, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': 'invalid',
+                                  'errors': serializer.errors}
+        created = 0
+        size = settings.BULK_CREATE_BATCH_SIZE
+        for start in range(0, len(valid), size):
+            indexes, batch = zip(*valid[start:start + size])
+            try:
+                with transaction.atomic():
+                    recipes = insert_recipes(request.user, batch)
+            except DatabaseError as error:
+                for index in indexes:
+                    results[index] = {'index': index, 'status': 'failed',
+                                      'errors': [str(error)]}
+                continue
+            created += len(recipes)
+            for index, recipe in zip(indexes, recipes):
+                results[index] = {'index': index, 'status': 'created',
+                                  'id': recipe.pk}
+        if created:
+            bump_version('recipes')
+        return Response({'created': created, 'results': results})
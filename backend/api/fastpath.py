@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from assistance.fieldsets import requested_fields
+from assistance.renderers import stream_json_array
+from recipes.models import AmountOfIngredient, Recipe, Tag
+from recipes.renditions import rendition_urls
+from .serializers import get_following_ids
+
+RECIPE_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'image': 'image',
+    'images': 'image_renditions',
+    'text': 'text',
+    'cooking_time': 'cooking_time',
+    'is_favorited': 'is_favorited',
+    'is_in_shopping_cart': 'is_in_shopping_cart',
+    'favorites_count': 'favorites_count',
+    'in_carts_count': 'in_carts_count',
+}
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+def recipe_rows(queryset, fields):
+    """Выборка рецептов в виде словарей только с нужными колонками."""
+    columns = ['id', 'pub_date']
+    # Поля явной сортировки (поиск, ?ordering=) нужны курсору.
+    columns += [field.lstrip('-') for field in queryset.query.order_by
+                if isinstance(field, str)]
+    columns += [RECIPE_COLUMNS[name] for name in fields
+                if name in RECIPE_COLUMNS]
+    if 'author' in fields:
+        columns += ['author__' + name for name in AUTHOR_FIELDS]
+    return queryset.prefetch_related(None).values(*dict.fromkeys(columns))
+
+
+def get_tags(recipe_ids):
+    tags = {}
+    rows = Tag.objects.filter(recipes__in=recipe_ids).order_by('id').values(
+        'recipes', 'id', 'name', 'color', 'slug')
+    for row in rows:
+        tags.setdefault(row.pop('recipes'), []).append(row)
+    return tags
+
+
+def get_ingredients(recipe_ids):
+    ingredients = {}
+    rows = AmountOfIngredient.objects.filter(
+        recipe_id__in=recipe_ids).order_by('id').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount')
+    for recipe_id, ingredient_id, name, unit, amount in rows:
+        ingredients.setdefault(recipe_id, []).append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+    return ingredients
+
+
+def serialize_recipes(rows, fields, context):
+    """Представление рецептов, совпадающее с RecipeReadOnlySerializer
+    (или RecipeAnonSerializer для анонимов), без экземпляров моделей и
+    полей DRF.
+
+    Связанные теги и ингредиенты загружаются одним запросом на всю пачку.
+    """
+    request = context.get('request')
+    anonymous = request.user.is_anonymous
+    recipe_ids = [row['id'] for row in rows]
+    tags = get_tags(recipe_ids) if 'tags' in fields else {}
+    ingredients = (get_ingredients(recipe_ids)
+                   if 'ingredients' in fields else {})
+    following_ids = (get_following_ids(context)
+                     if 'author' in fields and not anonymous else ())
+    storage = Recipe._meta.get_field('image').storage
+    data = []
+    for row in rows:
+        recipe_id = row['id']
+        item = {}
+        for name in fields:
+            if name == 'tags':
+                item[name] = tags.get(recipe_id, [])
+            elif name == 'ingredients':
+                item[name] = ingredients.get(recipe_id, [])
+            elif name == 'author':
+                author = {field: row['author__' + field]
+                          for field in AUTHOR_FIELDS}
+                if not anonymous:
+                    author['is_subscribed'] = author['id'] in following_ids
+                item[name] = author
+            elif name == 'image':
+                image = row['image']
+                item[name] = (request.build_absolute_uri(storage.url(image))
+                              if image else None)
+            elif name == 'images':
+                item[name] = rendition_urls(
+                    row['image_renditions'], storage, request)
+            else:
+                item[name] = row[RECIPE_COLUMNS[name]]
+        data.append(item)
+    return data
+
+
+def iter_recipes(queryset, fields, context, batch_size):
+    """Пачки представлений рецептов, читаемые курсором (на Postgres —
+    серверным), чтобы память не зависела от размера выборки."""
+    batch = []
+    for row in queryset.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield serialize_recipes(batch, fields, context)
+            batch = []
+    if batch:
+        yield serialize_recipes(batch, fields, context)
+
+
+class FastRecipeListMixin:
+    """Список рецептов через values() и пакетные запросы."""
+
+    def list(self, request, *args, **kwargs):
+        fields = requested_fields(
+            request, self.get_serializer_class().Meta.fields)
+        queryset = recipe_rows(
+            self.filter_queryset(self.get_queryset()), fields)
+        page = self.paginate_queryset(queryset)
+        context = self.get_serializer_context()
+        if page is not None:
+            return self.get_paginated_response(
+                serialize_recipes(page, fields, context))
+        return Response(serialize_recipes(list(queryset), fields, context))
+
+    @action(detail=False, url_path='export', methods=('get',))
+    def export(self, request):
+        """Все рецепты выборки одним потоковым JSON-массивом."""
+        fields = requested_fields(
+            request, self.get_serializer_class().Meta.fields)
+        queryset = recipe_rows(
+            self.filter_queryset(self.get_queryset()), fields)
+        return StreamingHttpResponse(
+            stream_json_array(iter_recipes(
+                queryset, fields, self.get_serializer_context(),
+                settings.EXPORT_BATCH_SIZE)),
+            content_type='application/json')
@@ -0,0 +1,83 @@
+import django_filters
+from django import forms
+from django.db.models import Exists, OuterRef
+
+from assistance.cache import ProcessCache
+from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
+
+_tag_ids = ProcessCache(
+    'tags', Tag, lambda: dict(Tag.objects.values_list('slug', 'id')))
+
+
+def get_tag_ids_by_slug():
+    """Словарь slug -> id тегов, хранится в памяти процесса."""
+    return _tag_ids.get()
+
+
+class TagSlugsField(forms.MultipleChoiceField):
+    """Список слагов без проверки по базе: неизвестные слаги
+    обрабатываются самим фильтром."""
+
+    def valid_value(self, value):
+        return True
+
+
+class TagSlugsFilter(django_filters.MultipleChoiceFilter):
+    field_class = TagSlugsField
+
+
+class RecipeFilter(django_filters.FilterSet):
+    """Фильтр рецептов по тегам: ?tags=a&tags=b.
+
+    ?tags_mode=any (по умолчанию) — хотя бы один из тегов,
+    ?tags_mode=all — все теги сразу. Каждый тег проверяется подзапросом
+    EXISTS, поэтому рецепты не дублируются.
+
+    ?search= — полнотекстовый поиск по названию и описанию, результаты
+    упорядочены по релевантности.
+
+    ?ordering=-favorites_count (или in_carts_count, с минусом или без) —
+    сортировка по числу добавлений в избранное или в корзину. По умолчанию
+    рецепты отсортированы по дате публикации.
+    """
+    tags = TagSlugsFilter(method='filter_tags')
+    search = django_filters.CharFilter(method='filter_search')
+    ordering = django_filters.ChoiceFilter(
+        method='filter_ordering',
+        choices=[(value, value) for value in (
+            'favorites_count', '-favorites_count',
+            'in_carts_count', '-in_carts_count')])
+
+    class Meta:
+        model = Recipe
+        fields = ('tags', 'search', 'ordering')
+
+    def filter_tags(self, queryset, name, slugs):
+        if not slugs:
+            return queryset
+        ids_by_slug = get_tag_ids_by_slug()
+        tag_ids = {ids_by_slug[slug] for slug in slugs if slug in ids_by_slug}
+        links = Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'))
+        if self.data.get('tags_mode') == 'all':
+            if len(tag_ids) < len(set(slugs)):
+                return queryset.none()
+            for tag_id in tag_ids:
+                queryset = queryset.filter(Exists(links.filter(tag_id=tag_id)))
+            return queryset
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(links.filter(tag_id__in=tag_ids)))
+
+    def filter_search(self, queryset, name, query):
+        query = query.strip()
+        if not query:
+            return queryset
+        return search_recipes(queryset, query).order_by(
+            '-search_rank', '-pub_date', '-id')
+
+    def filter_ordering(self, queryset, name, value):
+        # Дополнительные поля в том же направлении, что и основное, —
+        # так вся сортировка читается одним индексом.
+        prefix = '-' if value.startswith('-') else ''
+        return queryset.order_by(value, prefix + 'pub_date', prefix + 'id')
@@ -1,16 +1,72 @@
 from rest_framework import serializers
 from rest_framework.relations import SlugRelatedField
 from rest_framework.validators import UniqueTogetherValidator
+from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.db import connection, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.expressions import RawSQL
 
 #from drf_extra_fields.fields import Base64ImageField
-from assistance.field import Base64ImageField
+from assistance.field import Base64ImageField, ImageRenditionsField
+from assistance.cache import bump_version
+from assistance.fieldsets import SparseFieldsMixin
+from assistance.models import Job
 from users.models import User
+from recipes.shopping import apply_recipe_changes
 from recipes.models import (Recipe, Ingredient, Tag,
                             AmountOfIngredient, Favorite, Follow, Cart)
 
 
 
+def get_following_ids(context):
+    """Id авторов, на которых подписан пользователь запроса.
+
+    Загружаются одним запросом и кэшируются в контексте сериализатора,
+    общем для всех вложенных сериализаторов.
+    """
+    if 'following_ids' not in context:
+        follower = context.get('request').user
+        context['following_ids'] = set() if follower.is_anonymous else set(
+            Follow.objects.filter(user=follower).values_list(
+                'following_id', flat=True))
+    return context['following_ids']
+
+
+def get_recipes_limit(context):
+    """Число рецептов автора в ответе: ?recipes_limit=, но не больше
+    RECIPES_LIMIT."""
+    request = context.get('request')
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (AttributeError, KeyError, ValueError):
+        return settings.RECIPES_LIMIT
+    return min(max(limit, 0), settings.RECIPES_LIMIT)
+
+
+def latest_recipes(author_ids, limit):
+    """Последние limit рецептов каждого из авторов одним запросом.
+
+    Рецепты нумеруются оконной функцией ROW_NUMBER() внутри автора,
+    поэтому выборка не зависит от того, сколько рецептов у авторов всего.
+    """
+    qn = connection.ops.quote_name
+    sql = (
+        'SELECT {id} FROM (SELECT {id}, ROW_NUMBER() OVER ('
+        'PARTITION BY {author} ORDER BY {pub_date} DESC, {id} DESC'
+        ') AS {rank} FROM {table} WHERE {author} IN ({ids})) {ranked} '
+        'WHERE {rank} <= %s').format(
+            id=qn('id'), author=qn('author_id'), pub_date=qn('pub_date'),
+            rank=qn('recipe_rank'), ranked=qn('ranked'),
+            table=qn(Recipe._meta.db_table),
+            ids=', '.join(['%s'] * len(author_ids)))
+    return Recipe.objects.filter(
+        id__in=RawSQL(sql, (*author_ids, limit))).order_by(
+            '-pub_date', '-id').only(
+                'id', 'name', 'image', 'image_renditions', 'cooking_time',
+                'author_id')
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('first_name', 'last_name', 'username', 'email', 'password')
@@ -138,11 +194,11 @@ class UserNoRecipeSerializer(serializers.ModelSerializer):
             )
 
     def get_is_subscribed(self, user):
-        follower = self.context.get('request').user
-        return Follow.objects.filter(user=follower, following=user).exists()
+        return user.id in get_following_ids(self.context)
 
 
-class RecipeReadOnlySerializer(serializers.ModelSerializer):
+class RecipeReadOnlySerializer(SparseFieldsMixin,
+                               serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserNoRecipeSerializer(read_only=True)
     ingredients = IngredientsReadOnlySerializer(
@@ -151,6 +207,7 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
@@ -163,16 +220,23 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
+            'favorites_count',
+            'in_carts_count',
         )
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context.get('request').user
         if not user.is_anonymous:
             return Favorite.objects.filter(user=user, recipe=recipe).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context.get('request').user
         if not user.is_anonymous:
             return Cart.objects.filter(user=user, recipe=recipe).exists()
@@ -181,8 +245,7 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
 class RecipeCreateOrUpdateSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     ingredients = IngredientsCreateOrUpdateSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
     cooking_time = serializers.IntegerField(
         validators=(MinValueValidator(1),)
@@ -201,16 +264,34 @@ class RecipeCreateOrUpdateSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def existing_ids(self, model, ids):
+        """Какие из ids есть в базе.
+
+        При пакетной загрузке множества существующих id заранее получены
+        одним запросом на всю пачку и переданы в контексте.
+        """
+        known = self.context.get('known_ids', {}).get(model)
+        if known is not None:
+            return known & set(ids)
+        return set(model.objects.filter(id__in=ids).values_list(
+            'id', flat=True))
+
     def validate_ingredients(self, ingredients):
         if not ingredients:
             raise serializers.ValidationError(
                 'Рецепт должен содержать минимум 1 ингредиент!'
             )
-        for ingredient in ingredients:
-            if ingredients.count(ingredient) > 1:
-                raise serializers.ValidationError(
-                    'У рецепта не может быть два одинаковых ингредиента!'
-                )
+        ids = {ingredient['id'] for ingredient in ingredients}
+        if len(ids) != len(ingredients):
+            raise serializers.ValidationError(
+                'У рецепта не может быть два одинаковых ингредиента!'
+            )
+        missing = ids - self.existing_ids(Ingredient, ids)
+        if missing:
+            raise serializers.ValidationError(
+                'Нет ингредиентов с id: {}'.format(
+                    ', '.join(map(str, sorted(missing))))
+            )
         return ingredients
 
     def validate_tags(self, tags):
@@ -218,6 +299,13 @@ class RecipeCreateOrUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Для рецепта нужен хотя бы один тег!'
             )
+        tags = list(dict.fromkeys(tags))
+        missing = set(tags) - self.existing_ids(Tag, tags)
+        if missing:
+            raise serializers.ValidationError(
+                'Нет тегов с id: {}'.format(
+                    ', '.join(map(str, sorted(missing))))
+            )
         return tags
 
     def validate_cooking_time(self, cooking_time):
@@ -227,37 +315,84 @@ class RecipeCreateOrUpdateSerializer(serializers.ModelSerializer):
             )
         return cooking_time
 
-    def create_ingredients_amounts(self, ingredients, recipe):
-        '''Создает смежную модель для хранения ингредиентов и их кол-ва'''
-        objs = []
-        for ingredient in ingredients:
-            amount = ingredient.get('amount')
-            objs.append(AmountOfIngredient(
-                ingredient_id=ingredient['id'],
-                recipe=recipe,
-                amount=amount))
-        AmountOfIngredient.objects.bulk_create(objs)
-
+    def set_tags(self, recipe, tags, created=False):
+        """Добавляет и удаляет только изменившиеся связи с тегами."""
+        links = Recipe.tags.through.objects.filter(recipe=recipe)
+        current = set() if created else set(
+            links.values_list('tag_id', flat=True))
+        removed = current - set(tags)
+        if removed:
+            # У промежуточной таблицы нет ни сигналов, ни ссылок на нее,
+            # поэтому delete() выполняется одним DELETE.
+            links.filter(tag_id__in=removed).delete()
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+            for tag_id in tags if tag_id not in current])
+
+    def set_ingredients(self, recipe, ingredients, created=False):
+        """Приводит ингредиенты рецепта к ingredients, меняя только
+        отличающиеся строки. Возвращает прежние и новые количества."""
+        rows = AmountOfIngredient.objects.filter(recipe=recipe)
+        current = {} if created else {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in rows.values_list(
+                'pk', 'ingredient_id', 'amount')}
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        removed = [pk for ingredient_id, (pk, _) in current.items()
+                   if ingredient_id not in amounts]
+        if removed:
+            # post_delete на каждую строку дешев: дату рецепта и версию
+            # кэша сигнал обновляет один раз после коммита.
+            rows.filter(pk__in=removed).delete()
+        changed = [
+            AmountOfIngredient(pk=current[ingredient_id][0],
+                               amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id in current
+            and current[ingredient_id][1] != amount]
+        if changed:
+            AmountOfIngredient.objects.bulk_update(changed, ('amount',))
+        AmountOfIngredient.objects.bulk_create([
+            AmountOfIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                               amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current])
+        return ({ingredient_id: amount
+                 for ingredient_id, (_, amount) in current.items()},
+                amounts)
+
+    # Связи пишутся напрямую в промежуточные таблицы, без сигналов:
+    # дату изменения и версию кэша рецептов обновляет сохранение
+    # самого рецепта, список покупок — apply_recipe_changes.
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients_amounts(recipe=recipe,
-                                        ingredients=ingredients)
+        self.set_tags(recipe, tags, created=True)
+        self.set_ingredients(recipe, ingredients, created=True)
+        transaction.on_commit(lambda: bump_version('recipes'))
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients_amounts(recipe=instance,
-                                        ingredients=ingredients)
-        return super().update(instance, validated_data)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            self.set_tags(instance, tags)
+        if ingredients is not None:
+            old_amounts, new_amounts = self.set_ingredients(
+                instance, ingredients)
+            apply_recipe_changes(instance.pk, old_amounts, new_amounts)
+        instance = super().update(instance, validated_data)
+        transaction.on_commit(lambda: bump_version('recipes'))
+        return instance
 
     def to_representation(self, data):
+        prefetch_related_objects([data], 'tags', Prefetch(
+            'amounts_of_ingredients',
+            queryset=AmountOfIngredient.objects.select_related(
+                'ingredient').order_by('id')))
         return RecipeReadOnlySerializer(
             context=self.context).to_representation(data)
 
@@ -265,6 +400,7 @@ class RecipeCreateOrUpdateSerializer(serializers.ModelSerializer):
 
 class RecipeInSubscribeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
@@ -272,18 +408,42 @@ class RecipeInSubscribeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time',
         )
 
 
-class UserReadOnlySerializer(serializers.ModelSerializer):
+class UserListSerializer(serializers.ListSerializer):
+    """Список пользователей: рецепты всей страницы загружаются
+    одним запросом перед сериализацией."""
+
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        limit = get_recipes_limit(self.context)
+        author_ids = [user.pk for user in users]
+        if 'recipes' in self.child.fields and author_ids and limit:
+            prefetch_related_objects(users, Prefetch(
+                'recipes', queryset=latest_recipes(author_ids, limit),
+                to_attr='latest_recipes'))
+        return super().to_representation(users)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MAX_BATCH_SIZE)
+
+
+class UserReadOnlySerializer(SparseFieldsMixin,
+                             serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeInSubscribeSerializer(many=True)
-    #recipes = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
+        list_serializer_class = UserListSerializer
         fields = (
             'email',
             'id',
@@ -296,26 +456,24 @@ class UserReadOnlySerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, user):
-        follower = self.context.get('request').user
-        return Follow.objects.filter(user=follower, following=user).exists()
+        return user.id in get_following_ids(self.context)
 
     def get_recipes_count(self, user):
-        return user.recipes.count()
+        return user.recipes_count
 
-    #def less_recipes(self):
-      #  return Recipe.objects.all().filter(author=self)
-    
     def get_recipes(self, user):
-        if self.context.get('request').GET.get('recipes_limit'):
-            limit = int(self.context.get('request').GET.get(
-                    'recipes_limit'))
-        else:
-            limit=100
-        return RecipeInSubscribeSerializer(Recipe.objects.filter(
-            author=user), many=True).data[:limit]
-
-
-class UserAnonSerializer(serializers.ModelSerializer):
+        limit = get_recipes_limit(self.context)
+        if not limit:
+            return []
+        recipes = getattr(user, 'latest_recipes', None)
+        if recipes is None:
+            recipes = latest_recipes((user.pk,), limit)
+        return RecipeInSubscribeSerializer(
+            recipes, many=True, context=self.context).data
+
+
+class UserAnonSerializer(SparseFieldsMixin,
+                         serializers.ModelSerializer):
     class Meta:
         model = User
         fields = (
@@ -328,13 +486,15 @@ class UserAnonSerializer(serializers.ModelSerializer):
 
 
 
-class RecipeAnonSerializer(serializers.ModelSerializer):
+class RecipeAnonSerializer(SparseFieldsMixin,
+                           serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserAnonSerializer(read_only=True)
     ingredients = IngredientsReadOnlySerializer(
         many=True,
         source='amounts_of_ingredients')
     image = Base64ImageField()
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
@@ -345,8 +505,26 @@ class RecipeAnonSerializer(serializers.ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
+            'favorites_count',
+            'in_carts_count',
         )
 
 
+
+
+class JobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Job
+        fields = (
+            'id',
+            'name',
+            'status',
+            'attempts',
+            'result',
+            'created_at',
+            'finished_at',
+        )
@@ -0,0 +1,45 @@
+"""Пакетная загрузка рецептов принимает id так же, как одиночное создание."""
+import base64
+import io
+
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.bulk import referenced_ids
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def image_data():
+    output = io.BytesIO()
+    Image.new('RGB', (2, 2), 'white').save(output, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        output.getvalue()).decode()
+
+
+def test_referenced_ids_coerce_like_integer_field():
+    assert referenced_ids([
+        {'tags': [1, '2', ' 3 ', 'x', None],
+         'ingredients': [{'id': '4'}, {'id': 5.0}, {'id': []}, 'junk']},
+        'junk',
+    ]) == ({1, 2, 3}, {4, 5})
+
+
+def test_bulk_accepts_string_ids(db, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    author = User.objects.create(username='author', email='author@x.ru')
+    tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    client = APIClient()
+    client.force_authenticate(author)
+    response = client.post('/api/recipes/bulk/', [{
+        'name': 'Суп', 'text': 'Текст', 'cooking_time': 5,
+        'image': image_data(), 'tags': [str(tag.pk)],
+        'ingredients': [{'id': str(salt.pk), 'amount': 3}],
+    }], format='json')
+    assert response.status_code == 200, response.data
+    assert response.data['created'] == 1, response.data
+    recipe = Recipe.objects.get()
+    assert list(recipe.tags.all()) == [tag]
+    assert recipe.amounts_of_ingredients.get().ingredient == salt
+
@@ -0,0 +1,59 @@
+"""Условные запросы к рецептам: 304 только по ETag."""
+import pytest
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+FAR_FUTURE = 'Fri, 01 Jan 2100 00:00:00 GMT'
+
+
+@pytest.fixture
+def reader(db):
+    author = User.objects.create(username='author', email='author@x.ru')
+    for number in range(3):
+        Recipe.objects.create(author=author, name=f'Рецепт {number}',
+                              text='Текст', cooking_time=5)
+    return User.objects.create(username='reader', email='reader@x.ru')
+
+
+def client_for(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def test_no_last_modified_and_etag_revalidates(reader):
+    client = client_for(reader)
+    response = client.get('/api/recipes/')
+    assert 'Last-Modified' not in response
+    assert client.get('/api/recipes/', HTTP_IF_NONE_MATCH=response[
+        'ETag']).status_code == 304
+
+
+@pytest.mark.parametrize('change', ('favorite', 'cart', 'delete'))
+def test_if_modified_since_does_not_hide_changes(reader, change):
+    client = client_for(reader)
+    etag = client.get('/api/recipes/')['ETag']
+    recipe = Recipe.objects.first()
+    if change == 'delete':
+        recipe.delete()
+    else:
+        suffix = 'favorite' if change == 'favorite' else 'shopping_cart'
+        assert client.post(
+            f'/api/recipes/{recipe.id}/{suffix}/').status_code == 201
+    assert client.get(
+        '/api/recipes/', HTTP_IF_MODIFIED_SINCE=FAR_FUTURE).status_code == 200
+    assert client.get(
+        '/api/recipes/', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+def test_anonymous_list_after_reordering(reader):
+    client = client_for()
+    etag = client.get('/api/recipes/', {'limit': 1})['ETag']
+    Recipe.objects.order_by('-pub_date').first().delete()
+    response = client.get('/api/recipes/', {'limit': 1},
+                          HTTP_IF_MODIFIED_SINCE=FAR_FUTURE,
+                          HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
@@ -0,0 +1,117 @@
+"""Список рецептов через FastRecipeListMixin совпадает с сериализаторами."""
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from rest_framework.mixins import ListModelMixin
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.fastpath import FastRecipeListMixin
+from api.views import RecipeViewSet
+from recipes.models import (AmountOfIngredient, Cart, Favorite, Follow,
+                            Ingredient, Recipe, Tag)
+from users.models import User
+
+RENDITIONS = {
+    'source': 'recipes/1.png',
+    'thumbnail': {'webp': 'recipes/renditions/1-thumbnail.webp',
+                  'jpeg': 'recipes/renditions/1-thumbnail.jpg'},
+    'card': {'webp': 'recipes/renditions/1-card.webp',
+             'jpeg': 'recipes/renditions/1-card.jpg'},
+    'full': {'webp': 'recipes/renditions/1-full.webp',
+             'jpeg': 'recipes/renditions/1-full.jpg'},
+}
+QUERIES = (
+    {},
+    {'limit': 2, 'page': 2},
+    {'fields': 'id,name,author,is_favorited'},
+    {'omit': 'ingredients,text'},
+    {'fields': 'id,images,is_in_shopping_cart', 'is_in_shopping_cart': 1},
+    {'cursor': ''},
+    {'cursor': '', 'limit': 2, 'omit': 'tags'},
+    {'tags': 'lunch'},
+    {'ordering': '-favorites_count'},
+    {'ordering': 'in_carts_count', 'cursor': '', 'limit': 2},
+)
+
+
+class SerializerListView(RecipeViewSet):
+    def list(self, request, *args, **kwargs):
+        return ListModelMixin.list(self, request, *args, **kwargs)
+
+
+class FastListView(RecipeViewSet):
+    def list(self, request, *args, **kwargs):
+        return FastRecipeListMixin.list(self, request, *args, **kwargs)
+
+
+@pytest.fixture
+def users(db):
+    author = User.objects.create(
+        username='author', email='author@x.ru', first_name='Анна',
+        last_name='Ли')
+    reader = User.objects.create(
+        username='reader', email='reader@x.ru', first_name='Петр',
+        last_name='Ким')
+    breakfast = Tag.objects.create(
+        name='Завтрак', color='#E26C2D', slug='breakfast')
+    lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+    for number in range(5):
+        recipe = Recipe.objects.create(
+            author=author if number % 2 else reader, name=f'Рецепт {number}',
+            text='Текст', cooking_time=number + 1,
+            image=f'recipes/{number}.png' if number != 3 else '',
+            image_renditions=RENDITIONS if number == 1 else {})
+        recipe.tags.set((breakfast, lunch) if number % 2 else (lunch,))
+        AmountOfIngredient.objects.create(
+            recipe=recipe, ingredient=milk, amount=number + 10)
+        if number != 4:
+            AmountOfIngredient.objects.create(
+                recipe=recipe, ingredient=salt, amount=number + 1)
+        if number in (1, 2):
+            Favorite.objects.create(user=reader, recipe=recipe)
+        if number in (2, 3):
+            Cart.objects.create(user=reader, recipe=recipe)
+    Follow.objects.create(user=reader, following=author)
+    return author, reader
+
+
+def get(view_class, user, query):
+    request = APIRequestFactory().get('/api/recipes/', query)
+    if user is not None:
+        force_authenticate(request, user)
+    response = view_class.as_view({'get': 'list'})(request)
+    assert response.status_code == 200
+    return response.data
+
+
+def render(view_class, user, query):
+    return JSONRenderer().render(get(view_class, user, query))
+
+
+@pytest.mark.parametrize('query', QUERIES)
+@pytest.mark.parametrize('user_name', (None, 'reader', 'author'))
+def test_fast_list_matches_serializers(users, user_name, query):
+    user = User.objects.get(username=user_name) if user_name else None
+    assert render(FastListView, user, query) == render(
+        SerializerListView, user, query)
+
+
+@pytest.mark.parametrize('ordering', ('-favorites_count', 'in_carts_count'))
+def test_cursor_follows_counter_ordering(users, ordering):
+    field = ordering.lstrip('-')
+    expected = sorted(
+        Recipe.objects.values_list(field, 'pub_date', 'id'),
+        reverse=ordering.startswith('-'))
+    query = {'ordering': ordering, 'cursor': '', 'limit': 2,
+             'fields': 'id,' + field}
+    seen = []
+    while True:
+        data = get(FastListView, None, query)
+        seen += [item['id'] for item in data['results']]
+        if not data['next']:
+            break
+        query['cursor'] = parse_qs(urlparse(data['next']).query)['cursor'][0]
+    assert seen == [recipe_id for _, _, recipe_id in expected]
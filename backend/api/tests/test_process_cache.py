@@ -0,0 +1,19 @@
+"""Данные в памяти процесса замечают изменения из других процессов."""
+from recipes.autocomplete import get_ingredient_index
+from recipes.models import Ingredient, Tag
+from api.filters import get_tag_ids_by_slug
+
+
+def test_reloads_rows_added_elsewhere(db, settings):
+    # bulk_create без bump_version — как команда в другом процессе
+    # с собственным кэшем.
+    settings.PROCESS_CACHE_CHECK_INTERVAL = 0
+    assert get_ingredient_index().search('зюзюк') == []
+    assert 'soup' not in get_tag_ids_by_slug()
+    Ingredient.objects.bulk_create(
+        [Ingredient(name='зюзюка', measurement_unit='г')])
+    Tag.objects.bulk_create(
+        [Tag(name='Суп', color='#E26C2D', slug='soup')])
+    assert [item['name'] for item in get_ingredient_index().search(
+        'зюзюк')] == ['зюзюка']
+    assert 'soup' in get_tag_ids_by_slug()
@@ -0,0 +1,41 @@
+"""Пакетное избранное и корзина: статусы и счетчики по тому, что
+действительно изменили запросы (с RETURNING и без него)."""
+import pytest
+
+from assistance import utils
+from assistance.utils import (CREATED, DELETED, EXISTS, MISSING, NOT_FOUND,
+                              change_relations)
+from recipes.models import Cart, Favorite, Recipe
+from users.models import User
+
+
+@pytest.fixture(params=(True, False), ids=('returning', 'count'))
+def returning(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(utils, 'supports_returning', lambda conn: False)
+    return request.param
+
+
+@pytest.fixture
+def recipes(db):
+    author = User.objects.create(username='author', email='author@x.ru')
+    return [Recipe.objects.create(author=author, name=f'Рецепт {number}',
+                                  text='Текст', cooking_time=5).pk
+            for number in range(3)]
+
+
+@pytest.mark.parametrize('model, field', (
+    (Favorite, 'favorites_count'), (Cart, 'in_carts_count')))
+def test_statuses_and_counters(recipes, returning, model, field):
+    user = User.objects.create(username='reader', email='reader@x.ru')
+    first, second, third = recipes
+    model.objects.create(user=user, recipe_id=first)
+    Recipe.objects.filter(pk=first).update(**{field: 1})
+    assert change_relations(model, user, [first, second, 0], add=True) == {
+        first: EXISTS, second: CREATED, 0: NOT_FOUND}
+    assert change_relations(model, user, [second, third], add=False) == {
+        second: DELETED, third: MISSING}
+    assert dict(Recipe.objects.values_list('pk', field)) == {
+        first: 1, second: 0, third: 0}
+    assert set(model.objects.filter(user=user).values_list(
+        'recipe_id', flat=True)) == {first}
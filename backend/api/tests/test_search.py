@@ -0,0 +1,48 @@
+"""Поиск по рецептам в обоих режимах пагинации."""
+import pytest
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+RECIPES = (
+    ('Пирог с капустой', 'Пирог печем в духовке, пирог остужаем.'),
+    ('Салат', 'Подается к пирогу.'),
+    ('Пирог', 'Тесто.'),
+    ('Суп', 'Без выпечки.'),
+    ('Щи', 'К щам можно подать пироги.'),
+)
+
+
+@pytest.fixture
+def recipes(db):
+    author = User.objects.create(username='author', email='author@x.ru')
+    return [
+        Recipe.objects.create(author=author, name=name, text=text,
+                              cooking_time=10)
+        for name, text in RECIPES]
+
+
+def walk(client, **params):
+    """Id рецептов со всех страниц, по ссылкам next."""
+    data = client.get('/api/recipes/', params).json()
+    ids = [recipe['id'] for recipe in data['results']]
+    while data['next']:
+        assert len(ids) <= len(RECIPES)
+        data = client.get(data['next']).json()
+        ids += [recipe['id'] for recipe in data['results']]
+    return ids
+
+
+def test_search_finds_word_forms(recipes):
+    data = APIClient().get('/api/recipes/', {'search': 'пироги'}).json()
+    assert {recipe['id'] for recipe in data['results']} == {
+        recipes[0].id, recipes[1].id, recipes[2].id, recipes[4].id}
+
+
+def test_cursor_keeps_rank_order(recipes):
+    client = APIClient()
+    ranked = walk(client, search='пирог', limit=10)
+    by_date = [pk for pk in walk(client, limit=10) if pk in ranked]
+    assert ranked != by_date
+    assert walk(client, search='пирог', cursor='', limit=1) == ranked
@@ -4,7 +4,8 @@ from rest_framework.routers import DefaultRouter
 from django.conf import settings
 from django.conf.urls.static import static
 
-from .views import TagViewSet, IngredientViewSet, RecipeViewSet, UserViewSet
+from .views import (TagViewSet, IngredientViewSet, RecipeViewSet, UserViewSet,
+                    JobViewSet)
 
 
 router = DefaultRouter()
@@ -14,6 +15,7 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('users', UserViewSet, basename='users')
+router.register('jobs', JobViewSet, basename='jobs')
 
 
 urlpatterns = [
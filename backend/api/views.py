@@ -1,17 +1,17 @@
-import io
-
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
-from django.db.models import Sum
-from reportlab.lib.units import inch
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from django.utils.cache import get_conditional_response
+from django.http import FileResponse, StreamingHttpResponse
+from django.db.models import Exists, OuterRef, Prefetch
 
+from recipes.autocomplete import get_ingredient_index
+from recipes.shopping import shopping_list
 from recipes.models import (Recipe, Favorite, Cart, Ingredient,
                             Tag, Follow, AmountOfIngredient)
 from .serializers import (RecipeCreateOrUpdateSerializer,
@@ -20,20 +20,34 @@ from .serializers import (RecipeCreateOrUpdateSerializer,
                           IngredientSerializer,
                           FollowSerializer,
                           UserSerializer,
+                          JobSerializer,
                           UserReadOnlySerializer,
 			  RecipeInSubscribeSerializer,
 			  UserAnonSerializer,
 			  RecipeAnonSerializer)
+from .bulk import BulkRecipeCreateMixin
+from .fastpath import FastRecipeListMixin
+from .filters import RecipeFilter
 from .permissions import IsAuthorOrReadOnly
-from assistance.pagination import CustomPagination
+from assistance.fieldsets import requested_fields
+from assistance.cache import AnonymousCacheMixin, ConditionalGetMixin
+from assistance.pagination import RecipePagination, UserPagination
 from users.models import User
-from assistance.utils import favorite_or_cart
+from assistance.renderers import IgnoreFormatContentNegotiation
+from assistance.documents import document_cache
+from assistance.shopping_list import (CHUNK_LINES, DEFAULT_EXPORT_FORMAT,
+                                      EXPORT_FORMATS, document_digest,
+                                      render_pdf)
+from assistance.utils import favorite_or_cart, favorites_or_carts
+from assistance.jobs import accepted, enqueue
+from assistance.models import Job
+from assistance.tasks import render_shopping_list
 
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     #serializer_class = UserSerializer
-    pagination_class = CustomPagination
+    pagination_class = UserPagination
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -46,13 +60,7 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, url_path='me', methods=('get',),
             permission_classes=(IsAuthenticated,))
     def me(self, request):
-        serializer = self.get_serializer(
-            request.user, data=request.data, partial=True
-        )
-        serializer.is_valid(raise_exception=True)
-
-        serializer.save()
-
+        serializer = self.get_serializer(request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, url_path='subscribe', methods=('post', 'delete'),
@@ -92,36 +100,29 @@ class UserViewSet(viewsets.ModelViewSet):
 
 
 
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from django_filters import rest_framework as filters
-from django.db.models import Q
-import json
-
-import django_filters
-
-class RecipeFilter(django_filters.FilterSet):
-    '''class Meta:
-        model = Recipe
-        fields = ['tags__slug']'''
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
 
 
-
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    FastRecipeListMixin, BulkRecipeCreateMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           IsAuthorOrReadOnly)
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     #filter_backends = [filters.SearchFilter]
     #search_fields = ['tags__slug']
 
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    # favorites и carts — из-за счетчиков favorites_count и in_carts_count.
+    anonymous_cache_namespaces = ('recipes', 'tags', 'ingredients', 'users',
+                                  'favorites', 'carts')
+    anonymous_cache_timeout = settings.RECIPE_CACHE_TIMEOUT
+    conditional_namespaces = ('recipes', 'tags', 'ingredients', 'users',
+                              'favorites', 'carts')
+    personal_namespaces = ('favorites:%s', 'carts:%s', 'follows:%s')
+    conditional_cache_timeout = settings.RECIPE_CACHE_TIMEOUT
     #filterset_fields = ('tags__slug',)
     def get_serializer_class(self):
         if self.request.user.is_anonymous:
@@ -134,12 +135,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.save(author=self.request.user)
 
     def get_queryset(self):
+        fields = requested_fields(
+            self.request, self.get_serializer_class().Meta.fields)
         data = Recipe.objects.all()
-        if (not self.request.user.is_anonymous):
-            if self.request.GET.get('is_favorited') == "1":
-                data = data.filter(fav__user=self.request.user)
-            if self.request.GET.get('is_in_shopping_cart') == "1":
-                data = data.filter(recipe__user=self.request.user)
+        if 'author' in fields:
+            data = data.select_related('author')
+        if 'tags' in fields:
+            data = data.prefetch_related('tags')
+        if 'ingredients' in fields:
+            data = data.prefetch_related(Prefetch(
+                'amounts_of_ingredients',
+                queryset=AmountOfIngredient.objects.select_related(
+                    'ingredient').order_by('id')))
+        if 'text' not in fields:
+            data = data.defer('text')
+        user = self.request.user
+        if (not user.is_anonymous):
+            is_favorited = self.request.GET.get('is_favorited') == "1"
+            is_in_shopping_cart = (
+                self.request.GET.get('is_in_shopping_cart') == "1")
+            if is_favorited or 'is_favorited' in fields:
+                data = data.annotate(is_favorited=Exists(
+                    Favorite.objects.filter(
+                        user=user, recipe=OuterRef('pk'))))
+            if is_in_shopping_cart or 'is_in_shopping_cart' in fields:
+                data = data.annotate(is_in_shopping_cart=Exists(
+                    Cart.objects.filter(user=user, recipe=OuterRef('pk'))))
+            if is_favorited:
+                data = data.filter(is_favorited=True)
+            if is_in_shopping_cart:
+                data = data.filter(is_in_shopping_cart=True)
         if self.request.GET.get('author'):
             data = data.filter(author__id=self.request.GET.get('author'))
         #if self.request.GET.get('tags'):
@@ -156,34 +181,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk):
         return favorite_or_cart(self, Cart, pk)
 
-    @action(detail=False, url_path='download_shopping_cart', methods=('get',),
+    @action(detail=False, url_path='favorite', url_name='favorite-batch',
+            methods=('post', 'delete'),
+            permission_classes=(permissions.IsAuthenticated,))
+    def favorite_batch(self, request):
+        return favorites_or_carts(self, Favorite)
+
+    @action(detail=False, url_path='shopping_cart',
+            url_name='shopping-cart-batch', methods=('post', 'delete'),
             permission_classes=(permissions.IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return favorites_or_carts(self, Cart)
+
+    @action(detail=False, url_path='download_shopping_cart', methods=('get',),
+            permission_classes=(permissions.IsAuthenticated,),
+            content_negotiation_class=IgnoreFormatContentNegotiation)
     def download(self, request):
-        buffer = io.BytesIO()
-        pdfmetrics.registerFont(TTFont(name='arial', filename='assistance/font/Cyrillic/arial.TTF'))
-        p = canvas.Canvas(buffer, pagesize=letter, bottomup=0)
-        textob = p.beginText()
-        textob.setTextOrigin(inch, inch)
-        textob.setFont("arial", 14)
-        objs = (
-            AmountOfIngredient.objects.filter(
-                recipe__in=list(request.user.buyer.values_list(
-                    'recipe',
-                    flat=True)),)).select_related('recipes').values(
-                    'ingredient__name',
-                    'ingredient__measurement_unit',).annotate(
-                        summa=Sum('amount'))
-        for obj in objs:
-            line_out = (str(obj['ingredient__name']) + ' '
-                        + str(obj['ingredient__measurement_unit']) + ' '
-                        + str(obj['summa']))
-            textob.textLine(line_out.encode("utf-8"))
-        p.drawText(textob)
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-
-        return FileResponse(buffer, as_attachment=True, filename="venue.pdf")
+        export_format = request.query_params.get(
+            'format', DEFAULT_EXPORT_FORMAT)
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'format': 'Доступные форматы: {}.'.format(
+                ', '.join(EXPORT_FORMATS))})
+        content_type, filename, stream = EXPORT_FORMATS[export_format]
+        objs = shopping_list(request.user)
+        if stream is None:
+            # Документ попадает в кэш под дайджестом, поэтому дайджест
+            # и PDF строятся по одному и тому же чтению списка.
+            objs = list(objs)
+            digest = document_digest(export_format, objs)
+        else:
+            # Потоковые форматы читают список дважды (дайджест для ETag,
+            # затем тело), но целиком в памяти его не держат.
+            digest = document_digest(
+                export_format, objs.iterator(chunk_size=CHUNK_LINES))
+        etag = '"{}"'.format(digest)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            document_cache.count('not_modified')
+        elif stream is None:
+            document = document_cache.get(digest, export_format)
+            if (document is None
+                    and len(objs) > settings.SHOPPING_LIST_ASYNC_THRESHOLD):
+                # Большой список собирается в фоне; клиент опрашивает
+                # задачу и скачивает готовый документ из кэша.
+                return accepted(request, enqueue(
+                    render_shopping_list, user=request.user,
+                    key='{}.{}'.format(digest, export_format),
+                    user_id=request.user.pk, export_format=export_format))
+            if document is None:
+                document = document_cache.put(
+                    digest, export_format,
+                    lambda output: render_pdf(objs, output))
+            response = FileResponse(document, as_attachment=True,
+                                    filename=filename)
+        else:
+            response = StreamingHttpResponse(
+                stream(objs.iterator(chunk_size=CHUNK_LINES)),
+                content_type=content_type)
+            response['Content-Disposition'] = (
+                'attachment; filename="{}"'.format(filename))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Состояние фоновых задач текущего пользователя."""
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -193,8 +261,12 @@ class TagViewSet(viewsets.ModelViewSet):
 
 
 class IngredientViewSet(viewsets.ModelViewSet):
+    queryset = Ingredient.objects.all()
     pagination_class = None
     serializer_class = IngredientSerializer
-    def get_queryset(self):
-        queryset = Ingredient.objects.filter(name__istartswith=self.request.GET.get('name'))
-        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по ?name= из индекса в памяти процесса."""
+        name = request.query_params.get('name', '')
+        return Response(get_ingredient_index().search(
+            name, settings.INGREDIENT_SEARCH_LIMIT if name else None))
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class AssistanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'assistance'
+
+    def ready(self):
+        # Регистрирует фоновые задачи из модулей tasks.py приложений.
+        autodiscover_modules('tasks')
@@ -0,0 +1,207 @@
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.response import Response
+
+VERSION_KEY = 'version:%s'
+
+
+def new_version():
+    # Случайное значение, а не счетчик: после вытеснения ключа версии
+    # старые записи не станут снова актуальными, а одновременные сбросы
+    # из разных процессов не сольются в одно значение (incr файлового
+    # кэша не атомарен).
+    return uuid.uuid4().hex
+
+
+def get_version(namespace):
+    """Текущая версия пространства ключей кэша."""
+    key = VERSION_KEY % namespace
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(*namespaces):
+    """Сводная версия нескольких пространств.
+
+    Версии читаются одним get_many, а в ключи попадает их хэш: ключ
+    memcached ограничен 250 байтами.
+    """
+    keys = [VERSION_KEY % namespace for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            cache.add(key, new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return hashlib.md5('.'.join(
+        str(versions[key]) for key in keys).encode()).hexdigest()
+
+
+def bump_version(*namespaces):
+    """Инвалидирует все записи, построенные на старых версиях."""
+    cache.set_many({VERSION_KEY % namespace: new_version()
+                    for namespace in namespaces}, timeout=None)
+
+
+class ProcessCache:
+    """Данные из таблицы, загруженные в память процесса.
+
+    Перезагружаются, когда меняется версия пространства namespace или
+    состояние таблицы: число строк и наибольший id. Версию меняют сигналы
+    и команды, но при кэше, не общем для процессов, другой процесс ее не
+    увидит; состояние таблицы сверяется с базой не чаще раза в
+    PROCESS_CACHE_CHECK_INTERVAL секунд и замечает строки, добавленные
+    или удаленные где угодно.
+    """
+
+    def __init__(self, namespace, model, load):
+        self.namespace = namespace
+        self.model = model
+        self.load = load
+        self.key = None
+        self.checked_at = None
+        self.value = None
+
+    def get_state(self):
+        state = self.model._default_manager.order_by().aggregate(
+            total=Count('pk'), last=Max('pk'))
+        return state['total'], state['last']
+
+    def get(self):
+        version = get_version(self.namespace)
+        now = time.monotonic()
+        if (self.key is not None and self.key[0] == version
+                and now - self.checked_at
+                < settings.PROCESS_CACHE_CHECK_INTERVAL):
+            return self.value
+        key = (version, self.get_state())
+        if key != self.key:
+            self.value = self.load()
+            self.key = key
+        self.checked_at = now
+        return self.value
+
+
+class AnonymousCacheMixin:
+    """Общий кэш ответов list/retrieve для анонимных пользователей.
+
+    Ключ строится по нормализованной строке запроса и версиям
+    пространств anonymous_cache_namespaces, которые сбрасываются сигналами
+    при изменении данных.
+    """
+    anonymous_cache_namespaces = ()
+    anonymous_cache_timeout = 300
+
+    def get_anonymous_cache_key(self, request):
+        params = sorted(
+            (key, value) for key in request.query_params
+            for value in request.query_params.getlist(key) if value)
+        signature = hashlib.md5('|'.join((
+            request.scheme, request.get_host(), self.action,
+            str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)),
+            urlencode(params),
+        )).encode()).hexdigest()
+        return 'response:%s:%s:%s' % (
+            self.basename,
+            get_versions(*self.anonymous_cache_namespaces),
+            signature)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = self.get_anonymous_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.anonymous_cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """ETag для list/retrieve, ответ 304 без сериализации.
+
+    ETag учитывает строку запроса, версии conditional_namespaces и, для
+    авторизованных пользователей, их личные версии personal_namespaces,
+    поэтому персональные флаги не попадают в чужой кэш.
+
+    Last-Modified не отправляется: дата изменения строк не отражает ни
+    удаления, ни избранное и корзину пользователя, ни смену автора, и
+    по If-Modified-Since клиент получил бы устаревший 304.
+    """
+    conditional_namespaces = ()
+    personal_namespaces = ()
+    conditional_cache_timeout = 300
+
+    def get_conditional_queryset(self):
+        if self.action == 'list':
+            return self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.get_queryset().filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+    def get_conditional_etag(self, request):
+        """ETag запроса.
+
+        Число объектов выборки кэшируется под теми же версиями, что и
+        ETag, поэтому повторные запросы не обращаются к базе.
+        """
+        namespaces = list(self.conditional_namespaces)
+        user = request.user
+        if not user.is_anonymous:
+            namespaces += [namespace % user.pk
+                           for namespace in self.personal_namespaces]
+        params = sorted(
+            (key, value) for key in request.query_params
+            for value in request.query_params.getlist(key))
+        signature = hashlib.md5('|'.join((
+            self.action, request.path, urlencode(params), str(user.pk),
+            get_versions(*namespaces),
+        )).encode()).hexdigest()
+        key = 'conditional:%s:%s' % (self.basename, signature)
+        total = cache.get(key)
+        if total is None:
+            try:
+                total = self.get_conditional_queryset().order_by().count()
+            except (ValueError, TypeError):
+                return None
+            cache.set(key, total, self.conditional_cache_timeout)
+        return '"%s-%s"' % (signature, total)
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_conditional_etag(request)
+        response = None
+        if etag is not None:
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().retrieve, request, *args, **kwargs)
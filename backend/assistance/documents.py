@@ -0,0 +1,152 @@
+"""Файловый кэш сгенерированных документов по дайджесту содержимого.
+
+Имя файла — дайджест данных и формата, поэтому запись никогда не
+устаревает: изменилось содержимое — изменилось и имя. Объем кэша
+ограничен, при превышении удаляются файлы, которые дольше всех не
+запрашивались (время последнего обращения — mtime файла).
+
+Счетчики попаданий, промахов и ответов 304 лежат в файле рядом с
+документами: их пишут все процессы веб-сервера и фоновых задач, а
+читает команда document_cache.
+"""
+import fcntl
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+STATS = ('hits', 'misses', 'not_modified')
+STATS_FILE = '.stats'
+
+
+class DocumentCache:
+    def __init__(self, root=None, max_size=None):
+        self._root = root
+        self._max_size = max_size
+        self.lock = threading.Lock()
+
+    @property
+    def root(self):
+        return self._root or settings.DOCUMENT_CACHE_ROOT
+
+    @property
+    def max_size(self):
+        return self._max_size or settings.DOCUMENT_CACHE_MAX_SIZE
+
+    @property
+    def stats_path(self):
+        return os.path.join(self.root, STATS_FILE)
+
+    def count(self, event):
+        """Увеличивает счетчик event; файл блокируется на время записи."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.stats_path, 'a+') as stats_file:
+            fcntl.flock(stats_file, fcntl.LOCK_EX)
+            stats_file.seek(0)
+            stats = self.parse_stats(stats_file.read())
+            stats[event] += 1
+            stats_file.seek(0)
+            stats_file.truncate()
+            stats_file.write(' '.join(str(stats[name]) for name in STATS))
+
+    @staticmethod
+    def parse_stats(text):
+        values = [int(value) for value in text.split()]
+        if len(values) != len(STATS):
+            values = [0] * len(STATS)
+        return dict(zip(STATS, values))
+
+    def get_stats(self):
+        try:
+            with open(self.stats_path) as stats_file:
+                fcntl.flock(stats_file, fcntl.LOCK_SH)
+                return self.parse_stats(stats_file.read())
+        except FileNotFoundError:
+            return self.parse_stats('')
+
+    def reset_stats(self):
+        try:
+            os.unlink(self.stats_path)
+        except FileNotFoundError:
+            pass
+
+    def path(self, digest, extension):
+        return os.path.join(self.root, '{}.{}'.format(digest, extension))
+
+    def get(self, digest, extension):
+        """Открытый файл из кэша или None."""
+        path = self.path(digest, extension)
+        try:
+            document = open(path, 'rb')
+        except FileNotFoundError:
+            self.count('misses')
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Вытеснен другим процессом, но файл уже открыт.
+            pass
+        self.count('hits')
+        return document
+
+    def put(self, digest, extension, write):
+        """Создает документ вызовом write(файл) и возвращает его открытым.
+
+        Файл пишется во временный и переименовывается, поэтому
+        параллельные запросы не увидят недописанный документ.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        output = tempfile.NamedTemporaryFile(
+            dir=self.root, prefix='.tmp-', delete=False)
+        try:
+            with output:
+                write(output)
+            path = self.path(digest, extension)
+            os.replace(output.name, path)
+        except BaseException:
+            os.unlink(output.name)
+            raise
+        document = open(path, 'rb')
+        self.evict()
+        return document
+
+    def files(self):
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return []
+        files = []
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def evict(self):
+        """Удаляет давно не запрошенные файлы сверх max_size."""
+        with self.lock:
+            files = sorted(self.files())
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_size:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def clear(self):
+        for _, _, path in self.files():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+document_cache = DocumentCache()
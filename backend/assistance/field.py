@@ -1,31 +1,152 @@
-import base64
-import imghdr
+import binascii
+import io
 import uuid
-from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
-from django.utils.translation import ugettext_lazy as _
-
-from rest_framework.fields import ImageField
-
-DEFAULT_CONTENT_TYPE = "application/octet-stream"
-ALLOWED_IMAGE_TYPES = (
-    "jpeg",
-    "jpg",
-    "png",
-    "gif"
+
+from django.conf import settings
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import ImageField, ReadOnlyField
+
+from recipes.renditions import rendition_urls
+
+# Кусок base64 для декодирования за раз.
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n\f\v'
+# Сигнатуры поддерживаемых форматов: (начало файла, смещение, формат).
+SIGNATURES = (
+    (b'\xff\xd8\xff', 0, 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 0, 'png'),
+    (b'GIF87a', 0, 'gif'),
+    (b'GIF89a', 0, 'gif'),
+    (b'WEBP', 8, 'webp'),
 )
+EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'gif': 'gif', 'webp': 'webp'}
+HEADER_SIZE = 12
+
 
-EMPTY_VALUES = (None, '', [], (), {})
+def detect_format(header):
+    """Формат изображения по первым байтам файла."""
+    for signature, offset, image_format in SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            if image_format == 'webp' and not header.startswith(b'RIFF'):
+                continue
+            return image_format
+    return None
 
 
 class Base64ImageField(ImageField):
+    """Изображение из data URI (data:image/...;base64,...).
+
+    base64 декодируется кусками во временный файл: небольшие картинки
+    остаются в памяти, крупнее FILE_UPLOAD_MAX_MEMORY_SIZE — пишутся на
+    диск, как и обычные загрузки Django. Размер в байтах проверяется по
+    длине строки до декодирования, число пикселей — по заголовку файла.
+    Формат определяется по сигнатуре, а не по MIME-типу из data URI.
+    """
+    default_error_messages = {
+        'invalid_base64': _('Некорректные данные base64.'),
+        'unsupported_format': _(
+            'Поддерживаются изображения JPEG, PNG, GIF и WebP.'),
+        'too_large': _('Изображение больше {max_size} байт.'),
+        'too_many_pixels': _('Изображение больше {max_pixels} пикселей.'),
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')  # format ~= data:image/X,
-            ext = format.split('/')[-1]  # guess file extension
-            print(ext)
+            data = self.decode(data)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        start = data.find(';base64,')
+        if start < 0:
+            self.fail('invalid_base64')
+        start += len(';base64,')
+        # Переносы строк и пробелы в base64 допустимы и в размер не входят;
+        # считаются без копирования строки.
+        whitespace = sum(data.count(char, start) for char in WHITESPACE)
+        padding = ''.join(data[-16:].split())[-2:].count('=')
+        size = (len(data) - start - whitespace) * 3 // 4 - padding
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if size > max_size:
+            self.fail('too_large', max_size=max_size)
+        name = uuid.uuid4().hex
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            upload = TemporaryUploadedFile(
+                name, 'application/octet-stream', size, None)
+            output = upload.file
+        else:
+            upload = None
+            output = io.BytesIO()
+        try:
+            image_format = self.decode_into(data, start, output)
+        except ValidationError:
+            output.close()
+            raise
+        size = output.tell()
+        output.seek(0)
+        name = '{}.{}'.format(name, EXTENSIONS[image_format])
+        content_type = 'image/' + image_format
+        if upload is None:
+            return InMemoryUploadedFile(
+                output, None, name, content_type, size, None)
+        upload.name = name
+        upload.content_type = content_type
+        upload.size = size
+        return upload
+
+    def decode_into(self, data, start, output):
+        """Декодирует base64 в output и проверяет формат и размеры."""
+        # Из куска убираются пробельные символы, а хвост, не кратный
+        # четырем символам, переносится в следующий: иначе границы кусков
+        # разрезали бы группы base64.
+        rest = ''
+        try:
+            for position in range(start, len(data), CHUNK_SIZE):
+                chunk = rest + ''.join(
+                    data[position:position + CHUNK_SIZE].split())
+                whole = len(chunk) - len(chunk) % 4
+                output.write(binascii.a2b_base64(chunk[:whole]))
+                rest = chunk[whole:]
+            if rest:
+                output.write(binascii.a2b_base64(rest))
+        except binascii.Error:
+            self.fail('invalid_base64')
+        end = output.tell()
+        output.seek(0)
+        image_format = detect_format(output.read(HEADER_SIZE))
+        if image_format is None:
+            self.fail('unsupported_format')
+        output.seek(0)
+        self.check_pixels(output)
+        output.seek(end)
+        return image_format
+
+    def check_pixels(self, output):
+        """Число пикселей по заголовку; сами пиксели не декодируются."""
+        max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        try:
+            with Image.open(output) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        except OSError:
+            self.fail('invalid_image')
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+class ImageRenditionsField(ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения рецепта."""
 
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image_renditions')
+        super().__init__(**kwargs)
 
-        return super().to_internal_value(data)
\ No newline at end of file
+    def to_representation(self, value):
+        return rendition_urls(
+            value, self.parent.Meta.model._meta.get_field('image').storage,
+            self.context.get('request'))
@@ -0,0 +1,47 @@
+from rest_framework.serializers import ListSerializer
+
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+
+
+def requested_fields(request, available):
+    """Поля ответа с учетом параметров ?fields= и ?omit=.
+
+    Порядок полей сохраняется как в available; неизвестные имена
+    игнорируются.
+    """
+    fields = list(available)
+    if request is None or request.method != 'GET':
+        return fields
+    only = request.query_params.get(FIELDS_QUERY_PARAM)
+    if only:
+        only = set(only.split(','))
+        fields = [name for name in fields if name in only]
+    omit = request.query_params.get(OMIT_QUERY_PARAM)
+    if omit:
+        omit = set(omit.split(','))
+        fields = [name for name in fields if name not in omit]
+    return fields
+
+
+class SparseFieldsMixin:
+    """Оставляет в сериализаторе верхнего уровня только запрошенные поля.
+
+    Вложенные сериализаторы (например, автор рецепта) не урезаются.
+    """
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_root():
+            return fields
+        keep = set(requested_fields(self.context.get('request'), fields))
+        for name in list(fields):
+            if name not in keep:
+                fields.pop(name)
+        return fields
@@ -0,0 +1,241 @@
+"""Фоновые задачи без внешнего брокера.
+
+Задачи регистрируются декоратором task в модулях tasks.py приложений
+и ставятся в очередь функцией enqueue. Очередь — таблица Job; как ее
+обрабатывать, задает настройка JOBS_BACKEND:
+
+* database — задачи выполняет команда run_jobs (отдельный процесс);
+* thread — пул потоков в процессе веб-сервера, для разработки; повтор
+  после ошибки запускается таймером;
+* sync — сразу после фиксации транзакции в том же потоке (тесты);
+  повторы выполняются сразу, без задержки.
+
+В режимах thread и sync очередь живет в памяти процесса: задача, которую
+процесс не успел выполнить до перезапуска, через JOBS_TIMEOUT считается
+потерянной и при постановке такой же задачи заменяется новой.
+
+В любом режиме состояние и результат задачи читаются из таблицы,
+поэтому опрос /api/jobs/<id>/ работает одинаково.
+"""
+import datetime
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Job, JobStatus
+
+TASKS = {}
+ACTIVE = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def task(name=None, max_attempts=None):
+    """Регистрирует функцию как фоновую задачу.
+
+    Аргументы задачи передаются именованными и должны сериализоваться
+    в JSON; возвращаемое значение сохраняется в Job.result.
+    """
+    def register(function):
+        function.task_name = name or '{}.{}'.format(
+            function.__module__, function.__name__)
+        function.max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS
+        TASKS[function.task_name] = function
+        return function
+    return register
+
+
+def enqueue(function, user=None, key='', **kwargs):
+    """Ставит задачу в очередь и возвращает Job.
+
+    Если задан key и задача с таким ключом еще не выполнена,
+    возвращается она, новая не создается. Параллельные вызовы с одним
+    ключом разводит уникальный индекс по активным задачам.
+    """
+    fields = dict(name=function.task_name, kwargs=kwargs, key=key,
+                  user=user, max_attempts=function.max_attempts)
+    if not key:
+        job = Job.objects.create(**fields)
+    else:
+        job = active_job(function.task_name, key)
+        if job is not None:
+            return job
+        try:
+            with transaction.atomic():
+                job = Job.objects.create(**fields)
+        except IntegrityError:
+            job = active_job(function.task_name, key)
+            if job is None:
+                raise
+            return job
+    dispatch(job.pk)
+    return job
+
+
+def active_job(name, key):
+    """Невыполненная задача с ключом key или None."""
+    if settings.JOBS_BACKEND != 'database':
+        expire_lost(Job.objects.filter(name=name, key=key))
+    return Job.objects.filter(name=name, key=key, status__in=ACTIVE).first()
+
+
+def expire_lost(queryset):
+    """Помечает failed задачи, потерянные вместе с очередью в памяти
+    процесса (режимы thread и sync)."""
+    deadline = timezone.now() - datetime.timedelta(
+        seconds=settings.JOBS_TIMEOUT)
+    return queryset.filter(
+        Q(status=JobStatus.QUEUED, run_after__lt=deadline)
+        | Q(status=JobStatus.RUNNING, started_at__lt=deadline)).update(
+            status=JobStatus.FAILED, finished_at=timezone.now(),
+            error='Задача потеряна: процесс был перезапущен.')
+
+
+def dispatch(job_id, delay=0):
+    """Запускает задачу в режимах thread и sync после фиксации транзакции.
+
+    В режиме database задачи забирает run_jobs, здесь ничего не делается.
+    """
+    backend = settings.JOBS_BACKEND
+    if backend == 'thread':
+        def submit():
+            get_pool().submit(run_in_thread, job_id)
+        if delay:
+            timer = threading.Timer(delay, submit)
+            timer.daemon = True
+            transaction.on_commit(timer.start)
+        else:
+            transaction.on_commit(submit)
+    elif backend == 'sync':
+        transaction.on_commit(lambda: run_claimed(job_id))
+
+
+def result(job_id):
+    """Job по id или None."""
+    return Job.objects.filter(pk=job_id).first()
+
+
+def accepted(request, job):
+    """Ответ 202 со ссылкой для опроса состояния задачи."""
+    url = request.build_absolute_uri(reverse('jobs-detail', args=(job.pk,)))
+    response = Response({'id': job.pk, 'status': job.status,
+                         'status_url': url},
+                        status=status.HTTP_202_ACCEPTED)
+    response['Location'] = url
+    response['Retry-After'] = str(settings.JOBS_POLL_INTERVAL)
+    return response
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.JOBS_CONCURRENCY,
+                thread_name_prefix='jobs')
+    return _pool
+
+
+def run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_claimed(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim(job_id):
+    """Переводит задачу в running; False, если ее уже взял другой."""
+    return Job.objects.filter(
+        pk=job_id, status=JobStatus.QUEUED).update(
+            status=JobStatus.RUNNING, started_at=timezone.now()) == 1
+
+
+def claim_next():
+    """Берет следующую готовую к запуску задачу или возвращает None.
+
+    Захват — условный UPDATE по статусу, поэтому несколько
+    обработчиков не выполнят одну задачу дважды без SKIP LOCKED.
+    """
+    candidates = Job.objects.filter(
+        status=JobStatus.QUEUED, run_after__lte=timezone.now()).order_by(
+            'run_after', 'id').values_list('pk', flat=True)
+    for job_id in candidates[:settings.JOBS_CONCURRENCY * 2]:
+        if claim(job_id):
+            return job_id
+    return None
+
+
+def run_claimed(job_id):
+    if not claim(job_id):
+        return
+    run(Job.objects.get(pk=job_id))
+
+
+def run(job):
+    """Выполняет взятую задачу и сохраняет результат или ошибку.
+
+    После неудачи задача возвращается в очередь с экспоненциальной
+    задержкой, пока не исчерпаны попытки.
+    """
+    job.attempts += 1
+    function = TASKS.get(job.name)
+    try:
+        if function is None:
+            raise LookupError('Неизвестная задача {}'.format(job.name))
+        value = function(**job.kwargs)
+    except Exception:
+        job.error = traceback.format_exc()
+        if function is not None and job.attempts < job.max_attempts:
+            delay = settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.status = JobStatus.QUEUED
+            job.run_after = timezone.now() + datetime.timedelta(
+                seconds=delay)
+        else:
+            job.status = JobStatus.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = JobStatus.DONE
+        job.result = value
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.save(update_fields=(
+        'attempts', 'status', 'result', 'error', 'run_after',
+        'finished_at'))
+    if job.status == JobStatus.QUEUED:
+        dispatch(job.pk, delay)
+    return job
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, чей обработчик, видимо, упал.
+
+    Такой запуск считается попыткой; исчерпавшие попытки помечаются
+    как failed.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=JobStatus.RUNNING,
+        started_at__lt=now - datetime.timedelta(
+            seconds=settings.JOBS_TIMEOUT))
+    failed = stale.filter(attempts__gte=F('max_attempts') - 1).update(
+        status=JobStatus.FAILED, attempts=F('attempts') + 1,
+        error='Задача не завершилась за JOBS_TIMEOUT.', finished_at=now)
+    return failed + stale.update(
+        status=JobStatus.QUEUED, attempts=F('attempts') + 1)
+
+
+def delete_finished(older_than):
+    """Удаляет завершенные задачи старше older_than (timedelta)."""
+    return Job.objects.filter(
+        status__in=(JobStatus.DONE, JobStatus.FAILED),
+        finished_at__lt=timezone.now() - older_than).delete()[0]
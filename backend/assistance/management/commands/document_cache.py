@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from assistance.documents import document_cache
+
+
+class Command(BaseCommand):
+    help = 'Статистика кэша сгенерированных списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики попаданий и промахов.')
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить все файлы кэша.')
+
+    def handle(self, *args, **options):
+        stats = document_cache.get_stats()
+        requests = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / requests if requests else 0
+        files = document_cache.files()
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {ratio:.1%}')
+        self.stdout.write(f'Ответов 304: {stats["not_modified"]}')
+        self.stdout.write(
+            f'Файлов: {len(files)}, '
+            f'объем: {sum(size for _, size, _ in files)} '
+            f'из {document_cache.max_size} байт')
+        if options['reset']:
+            document_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
+        if options['clear']:
+            document_cache.clear()
+            self.stdout.write(self.style.SUCCESS('Кэш очищен'))
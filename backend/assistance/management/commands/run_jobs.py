@@ -0,0 +1,80 @@
+import datetime
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from assistance.jobs import claim_next, delete_finished, requeue_stale, run
+from assistance.models import Job
+
+# Как часто возвращать зависшие задачи и чистить старые, в секундах.
+MAINTENANCE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.JOBS_CONCURRENCY,
+            help='Число потоков-обработчиков.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза между проверками пустой очереди, в секундах.')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        self.maintain()
+        workers = [
+            threading.Thread(target=self.work, args=(stop, options),
+                             name=f'jobs-{number}')
+            for number in range(max(options['concurrency'], 1))]
+        for worker in workers:
+            worker.start()
+        last_maintenance = time.monotonic()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(timeout=1)
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    self.maintain()
+                    last_maintenance = time.monotonic()
+        except KeyboardInterrupt:
+            stop.set()
+            self.stdout.write('Остановка после текущих задач...')
+            for worker in workers:
+                worker.join()
+
+    def maintain(self):
+        requeued = requeue_stale()
+        deleted = delete_finished(
+            datetime.timedelta(days=settings.JOBS_RETENTION_DAYS))
+        if requeued or deleted:
+            self.stdout.write(
+                f'Возвращено в очередь: {requeued}, удалено: {deleted}')
+        close_old_connections()
+
+    def work(self, stop, options):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                job_id = claim_next()
+                if job_id is None:
+                    if options['once']:
+                        break
+                    stop.wait(options['poll_interval'])
+                    continue
+                job = run(Job.objects.get(pk=job_id))
+                self.stdout.write(
+                    f'{job.name} #{job.pk}: {job.status} '
+                    f'(попытка {job.attempts})')
+        finally:
+            connection.close()
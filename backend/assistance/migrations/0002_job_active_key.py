@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:16
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_duplicates(apps, schema_editor):
+    """Оставляет по одной невыполненной задаче на ключ — самую раннюю."""
+    Job = apps.get_model('assistance', 'Job')
+    active = Job.objects.filter(
+        status__in=('queued', 'running')).exclude(key='')
+    seen = set()
+    duplicates = []
+    for pk, name, key in active.order_by('id').values_list(
+            'pk', 'name', 'key'):
+        if (name, key) in seen:
+            duplicates.append(pk)
+        seen.add((name, key))
+    Job.objects.filter(pk__in=duplicates).update(
+        status='failed', finished_at=timezone.now(),
+        error='Дубликат задачи с тем же ключом.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('queued', 'running')), models.Q(('key', ''), _negated=True)), fields=('name', 'key'), name='assistance_job_active_key'),
+        ),
+    ]
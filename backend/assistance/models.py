@@ -1,7 +1,103 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class RoleChoices(models.TextChoices):
     USER = "user"
     MODERATOR = "moderator"
     ADMIN = "admin"
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job(models.Model):
+    '''Фоновая задача, выполняемая командой run_jobs.'''
+    name = models.CharField(
+        verbose_name='Задача',
+        max_length=200
+    )
+    kwargs = models.JSONField(
+        verbose_name='Аргументы',
+        default=dict,
+        blank=True
+    )
+    key = models.CharField(
+        verbose_name='Ключ для исключения дубликатов',
+        max_length=200,
+        blank=True,
+        db_index=True
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Владелец',
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        null=True,
+        blank=True
+    )
+    status = models.CharField(
+        verbose_name='Состояние',
+        max_length=10,
+        choices=JobStatus.choices,
+        default=JobStatus.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток',
+        default=3
+    )
+    result = models.JSONField(
+        verbose_name='Результат',
+        null=True,
+        blank=True
+    )
+    error = models.TextField(
+        verbose_name='Ошибка',
+        blank=True
+    )
+    run_after = models.DateTimeField(
+        verbose_name='Не раньше',
+        default=timezone.now
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Создана',
+        auto_now_add=True
+    )
+    started_at = models.DateTimeField(
+        verbose_name='Начата',
+        null=True,
+        blank=True
+    )
+    finished_at = models.DateTimeField(
+        verbose_name='Завершена',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='assistance_job_queue_idx'),
+        ]
+        constraints = [
+            # Одна невыполненная задача на ключ (см. enqueue).
+            models.UniqueConstraint(
+                fields=['name', 'key'],
+                condition=models.Q(status__in=('queued', 'running'))
+                & ~models.Q(key=''),
+                name='assistance_job_active_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
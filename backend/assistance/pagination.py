@@ -1,15 +1,309 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import get_versions
+
+
+class ExactCount:
+    """Точный COUNT(*) по отфильтрованному запросу."""
+
+    def count(self, queryset):
+        return queryset.count(), True
+
+
+class EstimatedCount:
+    """Точный подсчет до порога, выше порога — оценка.
+
+    На Postgres оценка берется из плана запроса (статистика планировщика),
+    на остальных СУБД возвращается сам порог.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+
+    def count(self, queryset):
+        threshold = self.threshold or settings.PAGINATION_ESTIMATE_THRESHOLD
+        capped = queryset[:threshold + 1].count()
+        if capped <= threshold:
+            return capped, True
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return max(int(plan[0]['Plan']['Plan Rows']), capped), False
+        return threshold, False
+
+
+class CachedCount:
+    """Кэширует результат другой стратегии по сигнатуре запроса.
+
+    Ключ включает версии пространств кэша, поэтому изменение рецептов,
+    избранного или корзины сразу делает старые значения неактуальными.
+    """
+    namespaces = ('recipes', 'tags', 'favorites', 'carts')
+
+    def __init__(self, strategy=None, timeout=None):
+        self.strategy = strategy or ExactCount()
+        self.timeout = timeout
+
+    def count(self, queryset):
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0, True
+        signature = hashlib.md5(
+            (sql + repr(params)).encode()).hexdigest()
+        key = 'count:%s:%s' % (get_versions(*self.namespaces), signature)
+        result = cache.get(key)
+        if result is None:
+            result = self.strategy.count(queryset)
+            cache.set(key, result, self.timeout
+                      or settings.PAGINATION_COUNT_TIMEOUT)
+        return tuple(result)
+
+
+class InexactPage(Page):
+    def __init__(self, object_list, number, paginator, has_more):
+        super().__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        return self.has_more
+
+
+class CountingPaginator(Paginator):
+    """Paginator, получающий число объектов от стратегии подсчета.
+
+    Если число неточное, границы страниц не проверяются по нему,
+    а наличие следующей страницы определяется по лишней записи.
+    """
+
+    def __init__(self, *args, count_strategy=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy or ExactCount()
+
+    @cached_property
+    def counted(self):
+        return self.count_strategy.count(self.object_list)
+
+    @property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def count_exact(self):
+        return self.counted[1]
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not objects and number > 1:
+            raise EmptyPage('That page contains no results')
+        return InexactPage(objects[:self.per_page], number, self,
+                           len(objects) > self.per_page)
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу (курсору) без OFFSET и COUNT(*).
+
+    Позиция страницы кодируется значениями полей сортировки последней
+    (или первой) записи, поэтому стоимость страницы не зависит от глубины.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering, page_size=None, max_page_size=None):
+        self.ordering = tuple(ordering)
+        self.page_size = page_size or api_settings.PAGE_SIZE
+        self.max_page_size = max_page_size
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        if self.max_page_size:
+            return min(page_size, self.max_page_size)
+        return page_size
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'p': position, 'r': reverse}, default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position, reverse = data['p'], bool(data['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+                len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_position(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = (row[name] if isinstance(row, dict)
+                     else getattr(row, name))
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def get_position_filter(self, position, reverse):
+        """Условие «строго после позиции» для составного ключа."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = '%s__%s' % (name, 'lt' if descending else 'gt')
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(
+                field[1:] if field.startswith('-') else '-' + field
+                for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(position, reverse))
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = self.encode_cursor(self.get_position(self.page[-1]), False)
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(
+                self.base_url, self.cursor_query_param, '')
+        cursor = self.encode_cursor(self.get_position(self.page[0]), True)
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_query_param = 'page'
+    max_page_size = settings.MAX_PAGE_SIZE
+    # Сортировка для режима курсора (?cursor=); None — режим отключен.
+    keyset_ordering = None
+    keyset = None
+    count_strategy = ExactCount()
+
+    @property
+    def django_paginator_class(self):
+        return partial(CountingPaginator, count_strategy=self.count_strategy)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.keyset_ordering
+                and KeysetPagination.cursor_query_param
+                in request.query_params):
+            self.keyset = KeysetPagination(
+                self.get_keyset_ordering(queryset), self.page_size,
+                self.max_page_size)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_keyset_ordering(self, queryset):
+        """Явная сортировка выборки (поиск, ?ordering=) идет первой,
+        иначе курсор перебил бы ее; keyset_ordering дополняет ее до
+        однозначной."""
+        ordering = tuple(field for field in queryset.query.order_by
+                         if isinstance(field, str))
+        names = {field.lstrip('-') for field in ordering}
+        return ordering + tuple(field for field in self.keyset_ordering
+                                if field.lstrip('-') not in names)
 
     def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
         return Response({
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
             'results': data
         })
+
+
+class RecipePagination(CustomPagination):
+    keyset_ordering = ('-pub_date', '-id')
+    count_strategy = CachedCount(EstimatedCount())
+
+
+class UserPagination(CustomPagination):
+    keyset_ordering = ('-id',)
@@ -0,0 +1,31 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """Поток JSON-объектов по одному на строку (application/x-ndjson).
+
+    Строки читаются из потока по одной, но возвращается список всех
+    объектов: разобранное тело целиком находится в памяти.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        items = []
+        if stream is None:
+            return items
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(
+                    'NDJSON parse error - строка {}: {}'.format(number, exc))
+        return items
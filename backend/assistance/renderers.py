@@ -0,0 +1,55 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumps(data):
+    """Компактный JSON в байтах, как у JSONRenderer, но быстрее."""
+    if orjson is None:
+        return JSONRenderer().render(data)
+    return orjson.dumps(
+        data, default=JSONEncoder().default, option=ORJSON_OPTIONS
+    ).replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+        b'\xe2\x80\xa9', b'\\u2029')
+
+
+def stream_json_array(batches):
+    """Генератор JSON-массива по частям: одна часть на пачку объектов."""
+    yield b'['
+    separator = b''
+    for batch in batches:
+        if batch:
+            yield separator + b','.join(dumps(item) for item in batch)
+            separator = b','
+    yield b']'
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson; с отступами — стандартная реализация."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(
+                accepted_media_type, renderer_context):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Согласование для действий, которые сами разбирают ?format=
+    и отдают готовый HttpResponse: рендерер нужен только для ошибок."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer = renderers[0]
+        return renderer, renderer.media_type
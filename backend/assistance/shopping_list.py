@@ -0,0 +1,141 @@
+"""Формирование файла списка покупок."""
+import csv
+import hashlib
+import os
+import threading
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .renderers import stream_json_array
+
+FONT_NAME = 'arial'
+FONT_PATH = os.path.join(
+    os.path.dirname(__file__), 'font', 'Cyrillic', 'arial.TTF')
+FONT_SIZE = 14
+LEADING = FONT_SIZE * 1.2
+PAGE_SIZE = letter
+MARGIN = inch
+# Меняется вместе с оформлением документов, чтобы сбросить их кэш.
+DOCUMENT_VERSION = 1
+# Строк в одной части потокового ответа.
+CHUNK_LINES = 500
+
+_font_lock = threading.Lock()
+
+
+def register_font():
+    """Регистрирует шрифт один раз на процесс: разбор TTF дорогой."""
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return
+    with _font_lock:
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(name=FONT_NAME,
+                                           filename=FONT_PATH))
+
+
+def format_line(item):
+    return '{} {} {}'.format(item['ingredient__name'],
+                             item['ingredient__measurement_unit'],
+                             item['summa'])
+
+
+def render_pdf(items, output):
+    """Пишет PDF со списком покупок в output.
+
+    Длинные строки переносятся по ширине страницы, при заполнении
+    страницы начинается новая.
+    """
+    register_font()
+    width, height = PAGE_SIZE
+    pdf = canvas.Canvas(output, pagesize=PAGE_SIZE, bottomup=0)
+
+    def begin_page():
+        text = pdf.beginText()
+        text.setTextOrigin(MARGIN, MARGIN)
+        text.setFont(FONT_NAME, FONT_SIZE, LEADING)
+        return text
+
+    text = begin_page()
+    y = MARGIN
+    for item in items:
+        for part in simpleSplit(format_line(item), FONT_NAME, FONT_SIZE,
+                                width - 2 * MARGIN):
+            if y + LEADING > height - MARGIN:
+                pdf.drawText(text)
+                pdf.showPage()
+                text = begin_page()
+                y = MARGIN
+            text.textLine(part)
+            y += LEADING
+    pdf.drawText(text)
+    pdf.showPage()
+    pdf.save()
+
+
+def document_digest(export_format, items):
+    """Дайджест строк списка покупок и формата документа."""
+    digest = hashlib.sha256('{}:{}\n'.format(
+        DOCUMENT_VERSION, export_format).encode())
+    for item in items:
+        digest.update('{}\x1f{}\x1f{}\x1e'.format(
+            item['ingredient__name'], item['ingredient__measurement_unit'],
+            item['summa']).encode())
+    return digest.hexdigest()
+
+
+def chunks(items, size=CHUNK_LINES):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_txt(items):
+    for chunk in chunks(items):
+        yield ''.join(format_line(item) + '\n' for item in chunk).encode()
+
+
+class Echo:
+    """Псевдофайл для csv.writer: write возвращает строку, а не пишет."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount')).encode()
+    for chunk in chunks(items):
+        yield ''.join(writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['summa'],
+        )) for item in chunk).encode()
+
+
+def stream_json(items):
+    return stream_json_array([{
+        'name': item['ingredient__name'],
+        'measurement_unit': item['ingredient__measurement_unit'],
+        'amount': item['summa'],
+    } for item in chunk] for chunk in chunks(items))
+
+
+# Формат: (Content-Type, имя файла, генератор частей ответа).
+# PDF не потоковый: собирается render_pdf и хранится в кэше документов.
+EXPORT_FORMATS = {
+    'pdf': ('application/pdf', 'venue.pdf', None),
+    'txt': ('text/plain; charset=utf-8', 'shopping_list.txt', stream_txt),
+    'csv': ('text/csv; charset=utf-8', 'shopping_list.csv', stream_csv),
+    'json': ('application/json', 'shopping_list.json', stream_json),
+}
+DEFAULT_EXPORT_FORMAT = 'pdf'
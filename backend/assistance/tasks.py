@@ -0,0 +1,24 @@
+import os
+
+from django.urls import reverse
+
+from recipes.shopping import shopping_list
+from .documents import document_cache
+from .jobs import task
+from .shopping_list import document_digest, render_pdf
+
+
+@task()
+def render_shopping_list(user_id, export_format):
+    """Собирает документ списка покупок в кэш документов."""
+    items = list(shopping_list(user_id))
+    digest = document_digest(export_format, items)
+    if not os.path.exists(document_cache.path(digest, export_format)):
+        document_cache.put(
+            digest, export_format,
+            lambda output: render_pdf(items, output)).close()
+    return {
+        'digest': digest,
+        'download_url': '{}?format={}'.format(
+            reverse('recipes-download'), export_format),
+    }
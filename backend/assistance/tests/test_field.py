@@ -0,0 +1,56 @@
+"""Декодирование изображений из base64 кусками."""
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from assistance.field import CHUNK_SIZE, Base64ImageField
+
+
+def png(size):
+    output = io.BytesIO()
+    Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)).save(
+        output, 'PNG')
+    return output.getvalue()
+
+
+def data_uri(content, line_length=None, newline='\n'):
+    encoded = base64.b64encode(content).decode()
+    if line_length:
+        encoded = newline.join(
+            encoded[start:start + line_length]
+            for start in range(0, len(encoded), line_length)) + newline
+    return 'data:image/png;base64,' + encoded
+
+
+@pytest.fixture
+def content():
+    content = png((250, 200))
+    assert len(content) * 4 // 3 > 2 * CHUNK_SIZE
+    return content
+
+
+@pytest.mark.parametrize('line_length, newline', (
+    (None, ''), (76, '\n'), (64, '\r\n'), (CHUNK_SIZE - 1, '\n')))
+def test_decodes_wrapped_base64(content, line_length, newline):
+    upload = Base64ImageField().decode(
+        data_uri(content, line_length, newline))
+    assert upload.read() == content
+    assert upload.size == len(content)
+
+
+def test_size_limit_ignores_whitespace(content, settings):
+    settings.IMAGE_UPLOAD_MAX_SIZE = len(content)
+    field = Base64ImageField()
+    assert field.decode(data_uri(content, 76)).size == len(content)
+    settings.IMAGE_UPLOAD_MAX_SIZE = len(content) - 1
+    with pytest.raises(ValidationError):
+        field.decode(data_uri(content, 76))
+
+
+def test_rejects_truncated_base64(content):
+    with pytest.raises(ValidationError):
+        Base64ImageField().decode(data_uri(content)[:-1])
@@ -0,0 +1,91 @@
+"""Очередь задач в режимах thread и sync: повторы, потерянные задачи и
+уникальность активной задачи по ключу."""
+import datetime
+import threading
+
+import pytest
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from assistance import jobs
+from assistance.jobs import enqueue, task
+from assistance.models import Job, JobStatus
+
+CALLS = []
+
+
+@task(name='tests.flaky')
+def flaky(failures):
+    CALLS.append(failures)
+    if len(CALLS) <= failures:
+        raise RuntimeError('сбой')
+    return len(CALLS)
+
+
+@pytest.fixture(autouse=True)
+def calls():
+    CALLS.clear()
+    return CALLS
+
+
+def test_sync_backend_retries(transactional_db, settings):
+    settings.JOBS_BACKEND = 'sync'
+    job = enqueue(flaky, failures=2)
+    job.refresh_from_db()
+    assert (job.status, job.attempts, job.result) == (
+        JobStatus.DONE, 3, 3)
+
+
+def test_thread_backend_schedules_retry(
+        db, settings, monkeypatch, django_capture_on_commit_callbacks):
+    settings.JOBS_BACKEND = 'thread'
+    settings.JOBS_RETRY_DELAY = 7
+    timers = []
+
+    class Timer(threading.Timer):
+        def start(self):
+            timers.append(self.interval)
+
+    monkeypatch.setattr(jobs.threading, 'Timer', Timer)
+    job = Job.objects.create(name='tests.flaky', kwargs={'failures': 1},
+                             status=JobStatus.RUNNING)
+    with django_capture_on_commit_callbacks(execute=True):
+        jobs.run(job)
+    assert job.status == JobStatus.QUEUED
+    assert timers == [7]
+
+
+def test_lost_job_is_replaced(db, settings):
+    settings.JOBS_BACKEND = 'sync'
+    lost = Job.objects.create(
+        name='tests.flaky', key='k',
+        run_after=timezone.now() - datetime.timedelta(
+            seconds=settings.JOBS_TIMEOUT + 1))
+    job = enqueue(flaky, key='k', failures=0)
+    assert job.pk != lost.pk
+    lost.refresh_from_db()
+    assert lost.status == JobStatus.FAILED
+    assert enqueue(flaky, key='k', failures=0).pk == job.pk
+
+
+def test_database_backend_keeps_waiting_job(db, settings):
+    settings.JOBS_BACKEND = 'database'
+    waiting = Job.objects.create(
+        name='tests.flaky', key='k',
+        run_after=timezone.now() - datetime.timedelta(
+            seconds=settings.JOBS_TIMEOUT + 1))
+    assert enqueue(flaky, key='k', failures=0).pk == waiting.pk
+
+
+def test_one_active_job_per_key(db, settings, monkeypatch):
+    settings.JOBS_BACKEND = 'database'
+    first = enqueue(flaky, key='k', failures=0)
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Job.objects.create(name='tests.flaky', key='k')
+    # Между проверкой и вставкой задачу создал параллельный запрос.
+    found = iter((None, first))
+    monkeypatch.setattr(jobs, 'active_job', lambda name, key: next(found))
+    assert enqueue(flaky, key='k', failures=0).pk == first.pk
+    monkeypatch.undo()
+    Job.objects.filter(pk=first.pk).update(status=JobStatus.DONE)
+    assert enqueue(flaky, key='k', failures=0).pk != first.pk
@@ -1,58 +1,156 @@
 from rest_framework import status
 from rest_framework.response import Response
+from django.db import DatabaseError, connections, transaction
 from django.shortcuts import get_object_or_404
 
-from recipes.models import Recipe, Favorite
-from api.serializers import RecipeInSubscribeSerializer
+from recipes.counters import change_counter
+from recipes.models import Recipe, Favorite, Cart
+from recipes.shopping import add_recipes, remove_recipes
+from api.serializers import RecipeIdsSerializer, RecipeInSubscribeSerializer
+from users.models import User
+from .cache import bump_version
 
-def favorite_or_cart(self, model, id):
-    objects = model.objects.filter(
-        user=self.request.user,
-        recipe=get_object_or_404(Recipe, id=id))
+# Счетчик рецепта и пространство кэша для каждой связи пользователь-рецепт.
+RELATIONS = {
+    Favorite: ('favorites_count', 'favorites'),
+    Cart: ('in_carts_count', 'carts'),
+}
+CREATED, EXISTS, DELETED, MISSING, NOT_FOUND = (
+    'created', 'exists', 'deleted', 'missing', 'not_found')
 
-    fav_flag = objects.exists()
-    if self.request.method == "POST":
-        if fav_flag:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        model.objects.create(user=self.request.user,
-                             recipe=get_object_or_404(Recipe, id=id))
-        serializer =  RecipeInSubscribeSerializer(Recipe.objects.get(id=id))
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-    if not fav_flag:
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-    objects.delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
+def supports_returning(connection):
+    """INSERT ... ON CONFLICT DO NOTHING и DELETE с RETURNING."""
+    if connection.vendor == 'postgresql':
+        return True
+    return (connection.vendor == 'sqlite'
+            and connection.Database.sqlite_version_info >= (3, 35))
+
+
+def relation_sql(model, connection):
+    quote = connection.ops.quote_name
+    return (quote(model._meta.db_table),
+            quote(model._meta.get_field('user').column),
+            quote(model._meta.get_field('recipe').column))
+
 
+def insert_relations(model, user, recipe_ids):
+    """Вставляет связи пользователя с рецептами одним запросом.
 
-import base64
-import imghdr
-import uuid
-from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
-from django.utils.translation import ugettext_lazy as _
+    Возвращает множество рецептов, строки которых действительно вставлены.
+    """
+    connection = connections[model.objects.db]
+    table, user_column, recipe_column = relation_sql(model, connection)
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return set()
+    with connection.cursor() as cursor:
+        if supports_returning(connection):
+            cursor.execute(
+                'INSERT INTO {0} ({1}, {2}) VALUES {3} '
+                'ON CONFLICT ({1}, {2}) DO NOTHING RETURNING {2}'.format(
+                    table, user_column, recipe_column,
+                    ', '.join(['(%s, %s)'] * len(recipe_ids))),
+                [value for pk in recipe_ids for value in (user.pk, pk)])
+            return {row[0] for row in cursor.fetchall()}
+    # Без RETURNING: вставленные строки — те, которых не было до вставки;
+    # подсчет после вставки в той же транзакции подтверждает это.
+    queryset = model.objects.filter(user=user, recipe_id__in=recipe_ids)
+    present = set(queryset.values_list('recipe_id', flat=True))
+    model.objects.bulk_create(
+        [model(user=user, recipe_id=pk) for pk in recipe_ids
+         if pk not in present],
+        ignore_conflicts=True)
+    if queryset.count() != len(recipe_ids):
+        raise DatabaseError('Связи изменены параллельной транзакцией.')
+    return set(recipe_ids) - present
 
-from rest_framework.fields import ImageField
 
-DEFAULT_CONTENT_TYPE = "application/octet-stream"
-ALLOWED_IMAGE_TYPES = (
-    "jpeg",
-    "jpg",
-    "png",
-    "gif"
-)
+def delete_relations(model, user, recipe_ids):
+    """Удаляет связи пользователя с рецептами одним запросом.
 
-EMPTY_VALUES = (None, '', [], (), {})
+    Возвращает множество рецептов, строки которых действительно удалены.
+    """
+    connection = connections[model.objects.db]
+    table, user_column, recipe_column = relation_sql(model, connection)
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return set()
+    sql = 'DELETE FROM {0} WHERE {1} = %s AND {2} IN ({3})'.format(
+        table, user_column, recipe_column, ', '.join(['%s'] * len(recipe_ids)))
+    params = [user.pk, *recipe_ids]
+    if supports_returning(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(sql + ' RETURNING ' + recipe_column, params)
+            return {row[0] for row in cursor.fetchall()}
+    present = set(model.objects.filter(
+        user=user, recipe_id__in=recipe_ids).values_list(
+            'recipe_id', flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if cursor.rowcount != len(present):
+            raise DatabaseError('Связи изменены параллельной транзакцией.')
+    return present
 
 
-class Base64ImageField(ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')  # format ~= data:image/X,
-            ext = format.split('/')[-1]  # guess file extension
-            print(ext)
+def change_relations(model, user, recipe_ids, add):
+    """Добавляет (add=True) или удаляет рецепты из избранного/корзины.
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+    Один INSERT ... ON CONFLICT DO NOTHING или один DELETE на весь набор;
+    какие рецепты добавлены или удалены, берется из RETURNING, то есть из
+    того, что запрос действительно изменил. Строка пользователя
+    блокируется на время транзакции, поэтому параллельные запросы одного
+    пользователя выполняются по очереди.
+    Сигналы при этом не отправляются: счетчики, список покупок и версии
+    кэша обновляются здесь же.
+
+    Возвращает {recipe_id: статус}.
+    """
+    field, namespace = RELATIONS[model]
+    with transaction.atomic(using=model.objects.db):
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list(
+            'pk', flat=True))
+        found = set(Recipe.objects.filter(id__in=recipe_ids).values_list(
+            'id', flat=True))
+        changed = (insert_relations if add else delete_relations)(
+            model, user, found)
+        if changed:
+            change_counter(Recipe, field, changed, 1 if add else -1)
+            if model is Cart:
+                (add_recipes if add else remove_recipes)(user.pk, changed)
+    if changed:
+        bump_version(namespace, '%s:%s' % (namespace, user.pk))
+    if add:
+        statuses = (CREATED, EXISTS)
+    else:
+        statuses = (DELETED, MISSING)
+    return {
+        pk: (NOT_FOUND if pk not in found
+             else statuses[0] if pk in changed else statuses[1])
+        for pk in recipe_ids
+    }
+
+
+def favorite_or_cart(self, model, id):
+    recipe = get_object_or_404(Recipe, id=id)
+    if self.request.method == "POST":
+        if change_relations(model, self.request.user, (recipe.pk,),
+                            add=True)[recipe.pk] != CREATED:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeInSubscribeSerializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    if change_relations(model, self.request.user, (recipe.pk,),
+                        add=False)[recipe.pk] != DELETED:
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-        return super().to_internal_value(data)
\ No newline at end of file
+def favorites_or_carts(self, model):
+    """Пакетное добавление или удаление рецептов по списку ids."""
+    serializer = RecipeIdsSerializer(data=self.request.data)
+    serializer.is_valid(raise_exception=True)
+    recipe_ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    results = change_relations(model, self.request.user, recipe_ids,
+                               add=self.request.method == "POST")
+    return Response({'results': [
+        {'id': pk, 'status': results[pk]} for pk in recipe_ids]})
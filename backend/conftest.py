@@ -0,0 +1,13 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def local_cache(settings):
+    """Свой кэш в памяти: тесты не видят файловый кэш запущенного
+    сервера и записи друг друга."""
+    settings.CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }}
+    cache.clear()
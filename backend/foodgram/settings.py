@@ -62,28 +62,29 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'localhost',
-        'PORT': '5432',
+# По умолчанию — SQLite в каталоге проекта. В docker-compose веб-сервер и
+# обработчик задач (run_jobs) должны работать с одной базой, поэтому там
+# задается Postgres: DB_ENGINE=django.db.backends.postgresql, DB_HOST=db.
+DB_ENGINE = os.getenv('DB_ENGINE', default='django.db.backends.sqlite3')
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.getenv(
+                'DB_NAME', default=os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
     }
-}
-
-
-'''DATABASES = {
-    'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
-        'NAME': os.getenv('DB_NAME', default='postgres'),
-        'USER': os.getenv('POSTGRES_USER', default='postgres'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
-        'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.getenv('DB_NAME', default='postgres'),
+            'USER': os.getenv('POSTGRES_USER', default='postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
+            'HOST': os.getenv('DB_HOST', default='db'),
+            'PORT': os.getenv('DB_PORT', default='5432')
+        }
     }
-}'''
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -110,6 +111,10 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
     'PAGE_SIZE': 10,
+    'DEFAULT_RENDERER_CLASSES': [
+        'assistance.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
 }
 
@@ -145,3 +150,82 @@ DJOSER = {
             'token_create': 'djoser.serializers.TokenCreateSerializer'},
     'LOGIN_FIELD': 'email'
 }
+
+# Кэш общий для всех процессов: версии ключей меняют и веб-сервер, и
+# команды, и обработчик фоновых задач (run_jobs). В рабочем окружении —
+# memcached (см. infra/docker-compose.yml):
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache,
+# CACHE_LOCATION=memcached:11211.
+# Без них — файловый кэш для разработки: он перечисляет весь каталог при
+# каждой записи, поэтому число файлов ограничено небольшим MAX_ENTRIES.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache')),
+    }
+}
+if CACHES['default']['BACKEND'].endswith('FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=1000)),
+    }
+
+# Время жизни кэшированного числа объектов в пагинации, секунды.
+PAGINATION_COUNT_TIMEOUT = 60
+# Выше этого числа объектов пагинация рецептов отдает оценку количества.
+PAGINATION_ESTIMATE_THRESHOLD = 10000
+# Время жизни кэша ответов о рецептах для анонимных пользователей, секунды.
+RECIPE_CACHE_TIMEOUT = 300
+# Максимальный размер страницы (?limit=); больше — через /recipes/export/.
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', default=100))
+# Размер пачки при потоковой выгрузке рецептов.
+EXPORT_BATCH_SIZE = 500
+# Как часто данные в памяти процесса (индекс ингредиентов, слаги тегов)
+# сверяются с таблицей в базе, секунды.
+PROCESS_CACHE_CHECK_INTERVAL = 5
+# Максимум подсказок при автодополнении ингредиентов.
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Кэш сгенерированных списков покупок (по дайджесту содержимого).
+# Вне MEDIA_ROOT: файлы отдаются только через API авторизованным.
+DOCUMENT_CACHE_ROOT = os.getenv(
+    'DOCUMENT_CACHE_ROOT', default=os.path.join(BASE_DIR, 'document_cache'))
+# Предельный размер кэша в байтах; лишнее вытесняется (LRU).
+DOCUMENT_CACHE_MAX_SIZE = int(os.getenv(
+    'DOCUMENT_CACHE_MAX_SIZE', default=100 * 1024 * 1024))
+# Наибольшее число рецептов автора в списках пользователей и подписок
+# (?recipes_limit= может только уменьшить его).
+RECIPES_LIMIT = int(os.getenv('RECIPES_LIMIT', default=100))
+# Наибольшее число рецептов в одном пакетном запросе к избранному/корзине.
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', default=100))
+# Пакетное создание рецептов: наибольшее число рецептов в запросе
+# и число рецептов, записываемых в одной транзакции.
+MAX_BULK_RECIPES = int(os.getenv('MAX_BULK_RECIPES', default=500))
+BULK_CREATE_BATCH_SIZE = 100
+# Ограничения на изображения рецептов в base64: байты после
+# декодирования и число пикселей.
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv(
+    'IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv(
+    'IMAGE_UPLOAD_MAX_PIXELS', default=25_000_000))
+
+# Фоновые задачи (assistance.jobs): database — выполняет команда
+# run_jobs, thread — пул потоков веб-процесса, sync — сразу (для тестов).
+# По умолчанию thread, чтобы runserver работал без отдельного процесса;
+# в docker-compose задается database и запускается сервис worker.
+JOBS_BACKEND = os.getenv('JOBS_BACKEND', default='thread')
+JOBS_CONCURRENCY = int(os.getenv('JOBS_CONCURRENCY', default=2))
+JOBS_MAX_ATTEMPTS = 3
+# Задержка перед повтором, секунды; удваивается с каждой попыткой.
+JOBS_RETRY_DELAY = 10
+# Задача в состоянии running дольше этого времени считается зависшей.
+JOBS_TIMEOUT = 15 * 60
+# Через сколько секунд клиенту стоит повторить опрос задачи.
+JOBS_POLL_INTERVAL = 2
+# Сколько дней хранить завершенные задачи.
+JOBS_RETENTION_DAYS = 7
+# Списки покупок длиннее этого числа строк в PDF собираются в фоне.
+SHOPPING_LIST_ASYNC_THRESHOLD = int(os.getenv(
+    'SHOPPING_LIST_ASYNC_THRESHOLD', default=1000))
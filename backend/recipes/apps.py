@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def reinstall_search(sender, using, plan=None, **kwargs):
+    """Восстанавливает триггеры поиска после перестройки таблиц SQLite."""
+    from .search import install
+    connection = connections[using]
+    tables = connection.introspection.table_names()
+    if connection.vendor == 'sqlite' and 'recipes_recipe' in tables:
+        install(connection)
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(reinstall_search, sender=self)
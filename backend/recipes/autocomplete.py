@@ -0,0 +1,67 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения.
+
+Справочник небольшой и почти не меняется, поэтому он целиком загружается
+в память и перезагружается, когда меняется версия 'ingredients' или
+таблица ингредиентов (см. ProcessCache).
+"""
+from bisect import bisect_left
+
+from assistance.cache import ProcessCache
+from .models import Ingredient
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Префиксный индекс по названиям ингредиентов.
+
+    Выдача ранжируется: сначала совпадение с началом названия, затем с
+    началом любого слова, затем вхождение подстроки. Внутри группы порядок
+    как у модели (по названию).
+    """
+
+    def __init__(self, rows):
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for pk, name, unit in rows]
+        self.names = [normalize(item['name']) for item in self.items]
+        self.prefixes = sorted(
+            (name, position) for position, name in enumerate(self.names))
+        self.word_prefixes = sorted(
+            (name[start:], position)
+            for position, name in enumerate(self.names)
+            for start in range(1, len(name))
+            if not name[start - 1].isalnum() and name[start].isalnum())
+
+    @staticmethod
+    def match_prefix(keys, query):
+        start = bisect_left(keys, (query,))
+        for key, position in keys[start:]:
+            if not key.startswith(query):
+                break
+            yield position
+
+    def search(self, query, limit=None):
+        query = normalize(query.strip())
+        if not query:
+            return self.items[:limit]
+        found = sorted(set(self.match_prefix(self.prefixes, query)))
+        seen = set(found)
+        words = sorted(
+            set(self.match_prefix(self.word_prefixes, query)) - seen)
+        found += words
+        seen.update(words)
+        if limit is None or len(found) < limit:
+            found += [position for position, name in enumerate(self.names)
+                      if query in name and position not in seen]
+        return [self.items[position] for position in found[:limit]]
+
+
+_index = ProcessCache('ingredients', Ingredient, lambda: IngredientIndex(
+    Ingredient.objects.values_list('id', 'name', 'measurement_unit')))
+
+
+def get_ingredient_index():
+    return _index.get()
@@ -0,0 +1,55 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def get_counters(apps=None):
+    """Денормализованные счетчики: (модель, поле, источник, внешний ключ)."""
+    if apps is None:
+        from users.models import User
+        from .models import Cart, Favorite, Recipe
+    else:
+        User = apps.get_model('users', 'User')
+        Recipe = apps.get_model('recipes', 'Recipe')
+        Favorite = apps.get_model('recipes', 'Favorite')
+        Cart = apps.get_model('recipes', 'Cart')
+    return (
+        (User, 'recipes_count', Recipe, 'author'),
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+        (Recipe, 'in_carts_count', Cart, 'recipe'),
+    )
+
+
+def change_counter(model, field, pks, delta):
+    """Атомарно меняет счетчик через F-выражение."""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{field + '__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def actual_count(source, foreign_key):
+    return Coalesce(Subquery(
+        source.objects.filter(**{foreign_key: OuterRef('pk')}).order_by(
+        ).values(foreign_key).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()), 0)
+
+
+def find_drift(apps=None):
+    """Записи, у которых счетчик расходится с фактическим числом."""
+    drift = []
+    for model, field, source, foreign_key in get_counters(apps):
+        rows = model.objects.annotate(
+            actual=actual_count(source, foreign_key)).exclude(
+                **{field: F('actual')}).values_list('pk', field, 'actual')
+        drift += [(model, field, pk, stored, actual)
+                  for pk, stored, actual in rows]
+    return drift
+
+
+def rebuild_counters(apps=None):
+    """Пересчитывает все счетчики, возвращает число исправленных записей."""
+    fixed = 0
+    for model, field, source, foreign_key in get_counters(apps):
+        fixed += model.objects.update(
+            **{field: actual_count(source, foreign_key)})
+    return fixed
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.renditions import update_renditions
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии, даже если они актуальны.')
+
+    def handle(self, *args, **options):
+        updated = failed = 0
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('id', 'image', 'image_renditions')
+        for recipe in recipes.iterator():
+            try:
+                updated += update_renditions(recipe, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {updated}, ошибок: {failed}'))
@@ -0,0 +1,90 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from assistance.cache import bump_version
+from recipes.models import Ingredient
+
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR.parent, 'data', 'ingredients.csv')
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def iter_json(file, chunk_size=64 * 1024):
+    """Потоковый разбор JSON-массива объектов без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Некорректный JSON')
+            else:
+                yield item['name'], item['measurement_unit']
+                continue
+        elif eof:
+            raise CommandError('Некорректный JSON')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+class Command(BaseCommand):
+    help = ('Загружает справочник ингредиентов из CSV (название, единица) '
+            'или JSON. Повторный запуск не создает дублей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path, batch_size = options['path'], options['batch_size']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        reader = iter_json if path.endswith('.json') else iter_csv
+        before = Ingredient.objects.count()
+        processed = 0
+        with open(path, encoding='utf-8') as file:
+            rows = reader(file)
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                batch = {(name.strip(), unit.strip()) for name, unit in chunk
+                         if name.strip() and unit.strip()}
+                with transaction.atomic():
+                    Ingredient.objects.bulk_create(
+                        [Ingredient(name=name, measurement_unit=unit)
+                         for name, unit in batch],
+                        ignore_conflicts=True)
+                processed += len(batch)
+                self.stdout.write(f'Обработано строк: {processed}')
+        bump_version('ingredients')
+        created = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: добавлено {created}, '
+            f'уже было {processed - created}'))
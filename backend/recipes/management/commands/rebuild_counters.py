@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import find_drift, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики рецептов, избранного и корзин.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        drift = find_drift()
+        for model, field, pk, stored, actual in drift:
+            self.stdout.write(
+                f'{model.__name__} {pk}: {field}={stored}, '
+                f'фактически {actual}')
+        if options['check']:
+            if drift:
+                raise CommandError(f'Расхождений: {len(drift)}')
+            self.stdout.write(self.style.SUCCESS('Счетчики согласованы'))
+            return
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны, исправлено записей: {len(drift)}'))
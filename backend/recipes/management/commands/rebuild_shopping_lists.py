@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.shopping import find_drift, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки покупок пользователей по корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, ничего не меняя.')
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Ограничиться пользователем (можно указать несколько раз).')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        drift = find_drift(user_ids)
+        for user_id, ingredient_id, stored, actual in drift:
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'{stored}, фактически {actual}')
+        if options['check']:
+            if drift:
+                raise CommandError(f'Расхождений: {len(drift)}')
+            self.stdout.write(self.style.SUCCESS('Списки покупок согласованы'))
+            return
+        rebuild_shopping_lists(user_ids=user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны, исправлено строк: {len(drift)}'))
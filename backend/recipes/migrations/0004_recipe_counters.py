@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+from recipes.counters import rebuild_counters
+
+
+def fill_counters(apps, schema_editor):
+    rebuild_counters(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_updated_at'),
+        ('users', '0003_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
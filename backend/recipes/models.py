@@ -97,11 +97,37 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False
+    )
+    image_renditions = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-favorites_count', '-pub_date', '-id'],
+                         name='recipes_favorites_count_idx'),
+            models.Index(fields=['-in_carts_count', '-pub_date', '-id'],
+                         name='recipes_in_carts_count_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -181,3 +207,34 @@ class AmountOfIngredient(models.Model):
 
     def __str__(self):
         return f'{self.ingredient}, {self.amount}'
+
+
+class ShoppingListItem(models.Model):
+    '''Сумма ингредиента по всем рецептам в корзине пользователя.'''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient}, {self.amount}'
@@ -0,0 +1,110 @@
+"""Уменьшенные копии изображений рецептов.
+
+Для каждого изображения создаются копии фиксированных размеров
+в WebP и JPEG; пути к ним хранятся в Recipe.image_renditions вместе
+с именем исходного файла, чтобы замена изображения обнаруживалась
+по несовпадению имени.
+"""
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from assistance.cache import bump_version
+
+# Название: (ширина, высота, обрезать ли до точного размера).
+RENDITIONS = {
+    'thumbnail': (160, 160, True),
+    'card': (600, 400, True),
+    'full': (1600, 1600, False),
+}
+# Формат: (формат Pillow, расширение, параметры сохранения).
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True,
+                             'progressive': True}),
+}
+RENDITIONS_DIR = 'recipes/renditions'
+SOURCE_KEY = 'source'
+
+
+def is_current(recipe):
+    renditions = recipe.image_renditions or {}
+    if not recipe.image:
+        return not renditions
+    return renditions.get(SOURCE_KEY) == recipe.image.name
+
+
+def render(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def build_renditions(recipe):
+    """Создает файлы копий и возвращает словарь для image_renditions."""
+    storage = recipe.image.storage
+    stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+    renditions = {SOURCE_KEY: recipe.image.name}
+    with recipe.image.open('rb') as source, Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'L'):
+            background = Image.new('RGB', original.size, 'white')
+            rgba = original.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            original = background
+        original = original.convert('RGB')
+        for name, (width, height, crop) in RENDITIONS.items():
+            image = render(original, width, height, crop)
+            renditions[name] = {}
+            for key, (image_format, extension, options) in FORMATS.items():
+                output = io.BytesIO()
+                image.save(output, image_format, **options)
+                renditions[name][key] = storage.save(
+                    '{}/{}-{}.{}'.format(
+                        RENDITIONS_DIR, stem, name, extension),
+                    ContentFile(output.getvalue()))
+    return renditions
+
+
+def delete_renditions(storage, renditions):
+    for name in RENDITIONS:
+        for path in (renditions or {}).get(name, {}).values():
+            storage.delete(path)
+
+
+def update_renditions(recipe, force=False):
+    """Создает или удаляет копии, если они не соответствуют изображению.
+
+    Возвращает True, если что-то изменилось.
+    """
+    from .models import Recipe
+
+    if not force and is_current(recipe):
+        return False
+    old = recipe.image_renditions or {}
+    renditions = build_renditions(recipe) if recipe.image else {}
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_renditions=renditions, updated_at=timezone.now())
+    recipe.image_renditions = renditions
+    delete_renditions(Recipe._meta.get_field('image').storage, old)
+    bump_version('recipes')
+    return True
+
+
+def rendition_urls(renditions, storage, request=None):
+    """Ссылки на копии для ответа API: {размер: {формат: url}}."""
+    if not renditions:
+        return None
+    urls = {}
+    for name in RENDITIONS:
+        urls[name] = {}
+        for key, path in renditions.get(name, {}).items():
+            url = storage.url(path)
+            urls[name][key] = (request.build_absolute_uri(url)
+                               if request is not None else url)
+    return urls
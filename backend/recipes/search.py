@@ -0,0 +1,152 @@
+"""Полнотекстовый поиск по названию и описанию рецептов.
+
+На Postgres — генерируемая колонка tsvector (русская морфология) с
+GIN-индексом, на SQLite — таблица FTS5, которую поддерживают триггеры.
+Обе структуры создаются миграцией и обновляются самой базой при любом
+изменении рецепта, в том числе через update() и bulk_create().
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_fts'
+SQLITE_TRIGGERS = {
+    'recipes_recipe_fts_ai': '''
+        AFTER INSERT ON recipes_recipe BEGIN
+            INSERT INTO {fts}(rowid, name, text)
+            VALUES (new.id, {new_name}, {new_text});
+        END''',
+    'recipes_recipe_fts_ad': '''
+        AFTER DELETE ON recipes_recipe BEGIN
+            INSERT INTO {fts}({fts}, rowid, name, text)
+            VALUES ('delete', old.id, {old_name}, {old_text});
+        END''',
+    'recipes_recipe_fts_au': '''
+        AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+            INSERT INTO {fts}({fts}, rowid, name, text)
+            VALUES ('delete', old.id, {old_name}, {old_text});
+            INSERT INTO {fts}(rowid, name, text)
+            VALUES (new.id, {new_name}, {new_text});
+        END''',
+}
+# Окончания, отбрасываемые у слов запроса на SQLite (FTS5 не умеет
+# русскую морфологию, поэтому ищем по префиксу основы).
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ого', 'его', 'ому',
+    'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий',
+    'ой', 'ей', 'ом', 'ем', 'ах', 'ях', 'ам', 'ям', 'ов', 'ев', 'ую', 'юю',
+    'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь',
+), key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+
+
+def normalize_sql(column):
+    return "replace(replace({0}, 'ё', 'е'), 'Ё', 'Е')".format(column)
+
+
+def install(conn=connection):
+    """Создает поисковые структуры, если их еще нет.
+
+    На SQLite перестройка таблицы рецептов в миграциях удаляет триггеры,
+    поэтому функция вызывается и после каждой миграции (post_migrate):
+    недостающие триггеры создаются заново, а индекс перестраивается.
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute(
+                "ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS "
+                "search_vector tsvector GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('russian', coalesce(name, '')), 'A')"
+                " || setweight(to_tsvector('russian', coalesce(text, '')),"
+                " 'B')) STORED")
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS recipes_recipe_search_idx '
+                'ON recipes_recipe USING GIN (search_vector)')
+        elif conn.vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5("
+                "name, text, content='', "
+                "tokenize='unicode61 remove_diacritics 2')".format(FTS_TABLE))
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = 'recipes_recipe'")
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = set(SQLITE_TRIGGERS) - existing
+            for name in missing:
+                cursor.execute('CREATE TRIGGER {0} {1}'.format(
+                    name, SQLITE_TRIGGERS[name].format(
+                        fts=FTS_TABLE,
+                        new_name=normalize_sql('new.name'),
+                        new_text=normalize_sql('new.text'),
+                        old_name=normalize_sql('old.name'),
+                        old_text=normalize_sql('old.text'))))
+            if missing:
+                cursor.execute(
+                    "INSERT INTO {0}({0}) VALUES ('delete-all')".format(
+                        FTS_TABLE))
+                cursor.execute(
+                    'INSERT INTO {0}(rowid, name, text) '
+                    'SELECT id, {1}, {2} FROM recipes_recipe'.format(
+                        FTS_TABLE, normalize_sql('name'),
+                        normalize_sql('text')))
+
+
+def uninstall(conn=connection):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS recipes_recipe_search_idx')
+            cursor.execute('ALTER TABLE recipes_recipe '
+                           'DROP COLUMN IF EXISTS search_vector')
+        elif conn.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute('DROP TRIGGER IF EXISTS {0}'.format(name))
+            cursor.execute('DROP TABLE IF EXISTS {0}'.format(FTS_TABLE))
+
+
+def stem(word):
+    for ending in RUSSIAN_ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= MIN_STEM_LENGTH):
+            return word[:-len(ending)]
+    return word
+
+
+def sqlite_match_query(query):
+    words = re.findall(r'\w+', query.casefold().replace('ё', 'е'))
+    return ' AND '.join('"%s"*' % stem(word) for word in words)
+
+
+def search_recipes(queryset, query):
+    """Фильтрует выборку рецептов по запросу и добавляет search_rank.
+
+    Чем больше search_rank, тем релевантнее рецепт.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('russian', %s)"
+        return queryset.filter(RawSQL(
+            'recipes_recipe.search_vector @@ ' + tsquery,
+            (query,), output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            # ts_rank возвращает real; в double precision значение
+            # точно переживает круг через курсор пагинации.
+            'ts_rank(recipes_recipe.search_vector, %s)::double precision'
+            % tsquery,
+            (query,), output_field=FloatField()))
+    if vendor == 'sqlite':
+        match = sqlite_match_query(query)
+        if not match:
+            return queryset.none().annotate(
+                search_rank=RawSQL('0', (), output_field=FloatField()))
+        return queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(FTS_TABLE),
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            'SELECT -bm25({0}, 10.0, 1.0) FROM {0} '
+            'WHERE {0} MATCH %s AND rowid = recipes_recipe.id'.format(
+                FTS_TABLE),
+            (match,), output_field=FloatField()))
+    return queryset.filter(name__icontains=query).annotate(
+        search_rank=RawSQL('0', (), output_field=FloatField()))
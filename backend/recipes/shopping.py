@@ -0,0 +1,167 @@
+"""Агрегированный список покупок пользователя.
+
+Таблица ShoppingListItem хранит сумму каждого ингредиента по рецептам
+в корзине. Она меняется на количества рецепта при добавлении и удалении
+Cart (сигналы) и при правке ингредиентов рецепта, который лежит в чьих-то
+корзинах (apply_recipe_changes из сериализатора), поэтому выгрузка списка
+покупок — одно чтение по индексу (user, ingredient).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+# Пользователей в одной транзакции пересчета.
+REBUILD_BATCH_SIZE = 500
+
+
+def get_models(apps=None):
+    if apps is None:
+        from .models import AmountOfIngredient, Cart, ShoppingListItem
+        return AmountOfIngredient, Cart, ShoppingListItem
+    return (apps.get_model('recipes', 'AmountOfIngredient'),
+            apps.get_model('recipes', 'Cart'),
+            apps.get_model('recipes', 'ShoppingListItem'))
+
+
+def recipe_amounts(recipe_ids):
+    """Суммы ингредиентов по рецептам: {ingredient_id: amount}."""
+    AmountOfIngredient, _, _ = get_models()
+    return dict(AmountOfIngredient.objects.filter(
+        recipe_id__in=recipe_ids).order_by().values(
+            'ingredient_id').annotate(total=Sum('amount')).values_list(
+                'ingredient_id', 'total'))
+
+
+def apply_deltas(user_ids, deltas):
+    """Меняет суммы ингредиентов у пользователей на deltas.
+
+    Недостающие строки создаются с нулем, затем все суммы меняются одним
+    UPDATE; строки, в которых ничего не осталось, удаляются.
+    """
+    _, _, ShoppingListItem = get_models()
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not user_ids or not deltas:
+        return
+    if any(delta > 0 for delta in deltas.values()):
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items() if delta > 0
+        ], ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    items.update(amount=Greatest(F('amount') + Case(
+        *(When(ingredient_id=ingredient_id, then=Value(delta))
+          for ingredient_id, delta in deltas.items()),
+        default=Value(0), output_field=IntegerField()), Value(0)))
+    if any(delta < 0 for delta in deltas.values()):
+        items.filter(amount=0).delete()
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_deltas((user_id,), recipe_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    apply_deltas((user_id,), {
+        pk: -amount for pk, amount in recipe_amounts(recipe_ids).items()})
+
+
+def apply_recipe_changes(recipe_id, old_amounts, new_amounts):
+    """Переносит правку ингредиентов рецепта в списки покупок тех,
+    у кого он в корзине."""
+    _, Cart, _ = get_models()
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    if any(deltas.values()):
+        apply_deltas(Cart.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True), deltas)
+
+
+def rebuild_shopping_lists(apps=None, user_ids=None,
+                           batch_size=REBUILD_BATCH_SIZE):
+    """Пересчитывает списки покупок по корзинам с нуля.
+
+    Пользователи обрабатываются пачками, каждая пачка — в своей транзакции
+    под блокировкой строк пользователей: читатели не видят пустого списка,
+    а изменения корзины (change_relations блокирует ту же строку) ждут
+    конца пачки и не теряются между чтением корзин и записью.
+
+    Возвращает число записанных строк.
+    """
+    _, Cart, _ = get_models(apps)
+    users = Cart._meta.get_field('user').related_model.objects.order_by('pk')
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    user_ids = list(users.values_list('pk', flat=True))
+    return sum(
+        rebuild_batch(apps, user_ids[start:start + batch_size])
+        for start in range(0, len(user_ids), batch_size))
+
+
+def rebuild_batch(apps, user_ids):
+    AmountOfIngredient, Cart, ShoppingListItem = get_models(apps)
+    User = Cart._meta.get_field('user').related_model
+    with transaction.atomic():
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+        carts = Cart.objects.filter(user_id__in=user_ids)
+        rows = AmountOfIngredient.objects.filter(
+            recipe_id__in=carts.values('recipe_id')).values_list(
+                'recipe_id', 'ingredient_id', 'amount')
+        amounts = {}
+        for recipe_id, ingredient_id, amount in rows.iterator():
+            recipe = amounts.setdefault(recipe_id, Counter())
+            recipe[ingredient_id] += amount
+        totals = {}
+        for user_id, recipe_id in carts.values_list('user_id', 'recipe_id'):
+            totals.setdefault(user_id, Counter()).update(
+                amounts.get(recipe_id, ()))
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        return len(ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=amount)
+            for user_id, total in totals.items()
+            for ingredient_id, amount in total.items() if amount > 0
+        ], batch_size=1000))
+
+
+def find_drift(user_ids=None):
+    """Расхождения таблицы с агрегатом по корзинам:
+    [(user_id, ingredient_id, сохранено, фактически)]."""
+    AmountOfIngredient, Cart, ShoppingListItem = get_models()
+    carts = Cart.objects.all()
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+        items = items.filter(user_id__in=user_ids)
+    actual = {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in carts.filter(
+            recipe__amounts_of_ingredients__isnull=False).values(
+                'user_id', 'recipe__amounts_of_ingredients__ingredient_id',
+            ).annotate(total=Sum(
+                'recipe__amounts_of_ingredients__amount')).values_list(
+                    'user_id',
+                    'recipe__amounts_of_ingredients__ingredient_id',
+                    'total')}
+    stored = {(user_id, ingredient_id): amount
+              for user_id, ingredient_id, amount in items.values_list(
+                  'user_id', 'ingredient_id', 'amount')}
+    drift = []
+    for key in sorted(stored.keys() | actual.keys()):
+        if stored.get(key, 0) != actual.get(key, 0):
+            drift.append((*key, stored.get(key, 0), actual.get(key, 0)))
+    return drift
+
+
+def shopping_list(user):
+    """Строки списка покупок в формате, который ждет выгрузка."""
+    _, _, ShoppingListItem = get_models()
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        summa=F('amount')).order_by(
+            'ingredient__name', 'ingredient__measurement_unit')
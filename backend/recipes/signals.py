@@ -0,0 +1,181 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from assistance.cache import bump_version
+from users.models import User
+from .counters import change_counter
+from .shopping import add_recipes, remove_recipes
+from .tasks import schedule_renditions
+from .models import (AmountOfIngredient, Cart, Favorite, Follow, Ingredient,
+                     Recipe, Tag)
+
+# Поля автора, которые попадают в ответы о рецептах.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def touch_recipes(*recipe_ids):
+    """Обновляет дату изменения рецептов без вызова save()."""
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now())
+
+
+def on_commit_once(key, function):
+    """Выполняет function после коммита один раз на транзакцию для key.
+
+    Пока вызов ждет в очереди on_commit, повторные вызовы с тем же ключом
+    ничего не делают; после отката очередь пуста, и ключ регистрируется
+    заново.
+    """
+    connection = transaction.get_connection()
+    pending = connection.__dict__.setdefault('pending_once', {})
+    queued = pending.get(key)
+    if queued is not None and any(
+            queued is entry[1] for entry in connection.run_on_commit):
+        return
+
+    def callback():
+        pending.pop(key, None)
+        function()
+
+    pending[key] = callback
+    transaction.on_commit(callback)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipes_changed(action='post', **kwargs):
+    if action.startswith('post'):
+        bump_version('recipes')
+
+
+@receiver(post_save, sender=AmountOfIngredient)
+@receiver(post_delete, sender=AmountOfIngredient)
+def recipe_ingredients_changed(instance, **kwargs):
+    # Сигнал приходит на каждую строку (delete() набора, каскад); дата
+    # рецепта и версия кэша обновляются один раз после коммита.
+    on_commit_once(('recipe', instance.recipe_id),
+                   lambda: touch_recipes(instance.recipe_id))
+    on_commit_once('recipes', lambda: bump_version('recipes'))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        touch_recipes(*instance.recipes.values_list('pk', flat=True))
+    elif not action.startswith('post'):
+        return
+    elif not reverse:
+        touch_recipes(instance.pk)
+    elif pk_set:
+        touch_recipes(*pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(**kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(**kwargs):
+    bump_version('ingredients')
+
+
+@receiver(pre_save, sender=User)
+def user_saving(instance, raw=False, update_fields=None, **kwargs):
+    """Запоминает, изменились ли поля автора, видимые в рецептах."""
+    if raw or instance.pk is None:
+        instance._author_changed = instance.pk is None
+        return
+    fields = [field for field in AUTHOR_FIELDS
+              if update_fields is None or field in update_fields]
+    old = (User.objects.filter(pk=instance.pk).values(*fields).first()
+           if fields else {})
+    instance._author_changed = old is None or any(
+        old[field] != getattr(instance, field) for field in fields)
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, **kwargs):
+    if getattr(instance, '_author_changed', True):
+        bump_version('users')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(**kwargs):
+    bump_version('users')
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorites_changed(instance, **kwargs):
+    bump_version('favorites', 'favorites:%s' % instance.user_id)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def carts_changed(instance, **kwargs):
+    bump_version('carts', 'carts:%s' % instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follows_changed(instance, **kwargs):
+    bump_version('follows:%s' % instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(User, 'recipes_count', (instance.author_id,), 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(User, 'recipes_count', (instance.author_id,), -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, 'favorites_count', (instance.recipe_id,), 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(instance, **kwargs):
+    change_counter(Recipe, 'favorites_count', (instance.recipe_id,), -1)
+
+
+@receiver(post_save, sender=Cart)
+def cart_created(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, 'in_carts_count', (instance.recipe_id,), 1)
+
+
+@receiver(post_delete, sender=Cart)
+def cart_deleted(instance, **kwargs):
+    change_counter(Recipe, 'in_carts_count', (instance.recipe_id,), -1)
+
+
+@receiver(post_save, sender=Cart)
+def cart_shopping_list_added(instance, created, **kwargs):
+    if created:
+        add_recipes(instance.user_id, (instance.recipe_id,))
+
+
+@receiver(pre_delete, sender=Cart)
+def cart_shopping_list_removed(instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его ингредиенты
+    # еще на месте, строки удаляются только после всех pre_delete.
+    remove_recipes(instance.user_id, (instance.recipe_id,))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(instance, raw=False, **kwargs):
+    if not raw:
+        schedule_renditions(instance)
@@ -0,0 +1,34 @@
+from assistance.jobs import enqueue, task
+from .counters import rebuild_counters as rebuild_all_counters
+from .models import Recipe
+from .renditions import is_current, update_renditions
+from .shopping import rebuild_shopping_lists as rebuild_all_shopping_lists
+
+
+@task()
+def generate_renditions(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'id', 'image', 'image_renditions').first()
+    if recipe is None:
+        return {'updated': False}
+    return {'updated': update_renditions(recipe)}
+
+
+@task()
+def rebuild_counters():
+    return {'fixed': rebuild_all_counters()}
+
+
+@task()
+def rebuild_shopping_lists():
+    return {'rows': rebuild_all_shopping_lists()}
+
+
+def schedule_renditions(recipe):
+    """Ставит в очередь создание копий, если изображение изменилось."""
+    if is_current(recipe):
+        return None
+    return enqueue(
+        generate_renditions,
+        key='renditions:{}:{}'.format(recipe.pk, recipe.image.name or ''),
+        recipe_id=recipe.pk)
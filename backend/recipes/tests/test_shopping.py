@@ -0,0 +1,160 @@
+"""Таблица списка покупок совпадает с агрегатом по корзинам.
+
+Случайные последовательности операций через API и модели; после
+каждого шага find_drift() должен быть пуст.
+"""
+import base64
+import io
+import random
+
+import pytest
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import (AmountOfIngredient, Cart, Ingredient, Recipe,
+                            ShoppingListItem, Tag)
+from recipes.shopping import find_drift, rebuild_shopping_lists, shopping_list
+from users.models import User
+
+SEEDS = range(12)
+STEPS = 40
+
+
+def image_data():
+    output = io.BytesIO()
+    Image.new('RGB', (2, 2), 'white').save(output, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        output.getvalue()).decode()
+
+
+class Scenario:
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.image = image_data()
+        self.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)]
+        self.users = [
+            User.objects.create(username=f'user{number}',
+                                email=f'user{number}@x.ru')
+            for number in range(3)]
+        self.clients = {}
+        for user in self.users:
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients[user.pk] = client
+        for _ in range(4):
+            self.create_recipe()
+
+    def pick_ingredients(self):
+        chosen = self.random.sample(
+            self.ingredients, self.random.randint(1, 4))
+        return [{'id': ingredient.id,
+                 'amount': self.random.randint(1, 500)}
+                for ingredient in chosen]
+
+    def recipe_ids(self):
+        return list(Recipe.objects.values_list('id', flat=True))
+
+    def user(self):
+        return self.random.choice(self.users)
+
+    def create_recipe(self):
+        user = self.user()
+        response = self.clients[user.pk].post('/api/recipes/', {
+            'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+            'image': self.image, 'tags': [self.tag.id],
+            'ingredients': self.pick_ingredients()}, format='json')
+        assert response.status_code == 201, response.data
+
+    def edit_recipe(self):
+        recipe = Recipe.objects.order_by('?').first()
+        data = {'ingredients': self.pick_ingredients()}
+        if self.random.random() < 0.3:
+            data['name'] = 'Новое название'
+        response = self.clients[recipe.author_id].patch(
+            f'/api/recipes/{recipe.id}/', data, format='json')
+        assert response.status_code == 200, response.data
+
+    def delete_recipe(self):
+        recipe = Recipe.objects.order_by('?').first()
+        response = self.clients[recipe.author_id].delete(
+            f'/api/recipes/{recipe.id}/')
+        assert response.status_code == 204
+
+    def cart_one(self):
+        client = self.clients[self.user().pk]
+        recipe_id = self.random.choice(self.recipe_ids())
+        method = self.random.choice((client.post, client.delete))
+        response = method(f'/api/recipes/{recipe_id}/shopping_cart/')
+        assert response.status_code in (201, 204, 400)
+
+    def cart_batch(self):
+        client = self.clients[self.user().pk]
+        recipe_ids = self.recipe_ids()
+        ids = self.random.sample(
+            recipe_ids, self.random.randint(1, min(3, len(recipe_ids))))
+        method = self.random.choice((client.post, client.delete))
+        response = method('/api/recipes/shopping_cart/', {'ids': ids},
+                          format='json')
+        assert response.status_code == 200, response.data
+
+    def cart_model(self):
+        # Путь через сигналы: админка, shell.
+        user = self.user()
+        recipe_id = self.random.choice(self.recipe_ids())
+        cart = Cart.objects.filter(user=user, recipe_id=recipe_id).first()
+        if cart is None:
+            Cart.objects.create(user=user, recipe_id=recipe_id)
+        else:
+            cart.delete()
+
+    def delete_ingredient(self):
+        if len(self.ingredients) > 4:
+            self.ingredients.pop(
+                self.random.randrange(len(self.ingredients))).delete()
+
+    def step(self):
+        operations = [self.cart_one, self.cart_batch, self.cart_model,
+                      self.edit_recipe, self.create_recipe,
+                      self.delete_ingredient]
+        if Recipe.objects.count() > 2:
+            operations.append(self.delete_recipe)
+        operation = self.random.choice(operations)
+        operation()
+        return operation.__name__
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_random_operations_keep_shopping_lists_exact(
+        db, settings, tmp_path, seed):
+    settings.MEDIA_ROOT = str(tmp_path)
+    scenario = Scenario(seed)
+    history = []
+    for _ in range(STEPS):
+        history.append(scenario.step())
+        assert find_drift() == [], history
+    for user in scenario.users:
+        expected = {}
+        for row in AmountOfIngredient.objects.filter(
+                recipe__recipe__user=user).values(
+                    'ingredient__name', 'amount'):
+            name = row['ingredient__name']
+            expected[name] = expected.get(name, 0) + row['amount']
+        assert {row['ingredient__name']: row['summa']
+                for row in shopping_list(user)} == expected
+
+
+def test_rebuild_in_batches_restores_lists(db, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    scenario = Scenario(0)
+    for _ in range(STEPS):
+        scenario.step()
+    ShoppingListItem.objects.update(amount=999)
+    ShoppingListItem.objects.filter(user=scenario.users[0]).delete()
+    assert find_drift()
+    rebuild_shopping_lists(batch_size=1)
+    assert find_drift() == []
@@ -0,0 +1,26 @@
+"""Сигналы ингредиентов рецепта срабатывают один раз на транзакцию."""
+from assistance.cache import get_version
+from recipes.models import AmountOfIngredient, Ingredient, Recipe
+from users.models import User
+
+
+def test_ingredient_rows_touch_recipe_once(
+        db, django_capture_on_commit_callbacks):
+    author = User.objects.create(username='author', email='author@x.ru')
+    recipe = Recipe.objects.create(author=author, name='Суп', text='Текст',
+                                   cooking_time=5)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        for number in range(3):
+            AmountOfIngredient.objects.create(
+                recipe=recipe, amount=number + 1,
+                ingredient=Ingredient.objects.create(
+                    name=f'ингредиент {number}', measurement_unit='г'))
+    assert len(callbacks) == 2
+    updated_at = Recipe.objects.get(pk=recipe.pk).updated_at
+    version = get_version('recipes')
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        AmountOfIngredient.objects.filter(recipe=recipe).delete()
+        AmountOfIngredient.objects.filter(recipe=recipe).delete()
+    assert len(callbacks) == 2
+    assert Recipe.objects.get(pk=recipe.pk).updated_at > updated_at
+    assert get_version('recipes') != version
@@ -38,3 +38,8 @@ class User(AbstractUser):
         choices=RoleChoices.choices,
         default=RoleChoices.USER,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )